@@ -0,0 +1,72 @@
+"""Compares writing blank saves with write_zeros to writing them as one bytes object, like installs used to.
+
+Run from the root of the repository with python -m benchmarks.blank_saves. Saves are written to a temporary
+directory (or --dir, to time a particular disk like an SD card). It prints the time taken and the peak Python
+allocation while writing, and exits with 1 if the two ways write different files.
+"""
+
+import sys
+import tracemalloc
+from argparse import ArgumentParser
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import perf_counter
+
+from installer.pipeline import write_zeros
+
+# (save size, saves written)
+CASES = ((0x80000, 150), (0x100000, 150), (0x2000000, 10))
+
+
+def write_whole(o, size: int):
+    o.write(b'\0' * size)
+
+
+def write_saves(directory: str, name: str, writer, save_size: int, count: int):
+    tracemalloc.start()
+    start = perf_counter()
+    for i in range(count):
+        # the same layout as a new save on the SD card
+        with open(join(directory, f'{name}{i}.sav'), 'wb') as o:
+            o.write(bytes(0x20))
+            writer(o, save_size - 0x20)
+    seconds = perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def same_files(directory: str, count: int):
+    for i in range(count):
+        with open(join(directory, f'whole{i}.sav'), 'rb') as a, open(join(directory, f'chunked{i}.sav'), 'rb') as b:
+            if a.read() != b.read():
+                return False
+    return True
+
+
+def main():
+    argparser = ArgumentParser(description='Time writing blank saves.')
+    argparser.add_argument('--dir', help='directory to write the saves in, defaults to a temporary one')
+    args = argparser.parse_args()
+
+    directory = mkdtemp(dir=args.dir)
+    same = True
+    try:
+        for save_size, count in CASES:
+            old_seconds, old_peak = write_saves(directory, 'whole', write_whole, save_size, count)
+            new_seconds, new_peak = write_saves(directory, 'chunked', write_zeros, save_size, count)
+            matches = same_files(directory, count)
+            same = same and matches
+            print(f'{save_size // 1024:6} KiB x{count:<4} one bytes object {old_seconds * 1000:6.0f} ms, '
+                  f'peak {old_peak / 1024:6.0f} KiB   write_zeros {new_seconds * 1000:6.0f} ms, '
+                  f'peak {new_peak / 1024:6.0f} KiB{"" if matches else "   DIFFERENT FILES"}')
+    finally:
+        rmtree(directory)
+
+    print('all files match' if same else 'files differ')
+    return 0 if same else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
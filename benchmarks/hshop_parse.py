@@ -0,0 +1,78 @@
+"""Times the hShop page parsers on the pages in benchmarks/fixtures, and checks that they all agree.
+
+Run from the root of the repository with python -m benchmarks.hshop_parse. Every page is parsed three ways: the
+whole document with html.parser (how pages were parsed before hshop.parse only built the elements it needs), the
+html.parser path with a SoupStrainer, and the lxml path if lxml is installed. It exits with 1 if any of them give
+different results.
+"""
+
+import sys
+from argparse import ArgumentParser
+from os.path import dirname, join
+from time import perf_counter
+
+from bs4 import BeautifulSoup
+
+import hshop.parse as parse
+
+FIXTURES = join(dirname(__file__), 'fixtures')
+
+PAGES = (
+    ('search', 'hshop-search.html', parse.parse_search_results),
+    ('related', 'hshop-title.html', parse.parse_related_content),
+    ('download', 'hshop-title.html', parse.parse_download_url),
+)
+
+
+def whole_document(text: str, tag: str, class_name: str) -> BeautifulSoup:
+    return BeautifulSoup(text, 'html.parser')
+
+
+def timed(function, text: str, repeat: int):
+    # the first one is left out, so imports and caches don't count
+    result = function(text)
+    start = perf_counter()
+    for _ in range(repeat):
+        function(text)
+    return (perf_counter() - start) / repeat, result
+
+
+def main():
+    argparser = ArgumentParser(description='Time the hShop page parsers on saved pages.')
+    argparser.add_argument('-n', '--repeat', type=int, default=20, help='times each page is parsed (default: 20)')
+    args = argparser.parse_args()
+
+    lxml_html = parse.lxml_html
+    paths = [('whole page', whole_document, None), ('html.parser', parse._parse, None)]
+    if lxml_html is not None:
+        paths.append(('lxml', parse._parse, lxml_html))
+    else:
+        print('lxml is not installed, only html.parser is timed')
+
+    real_parse = parse._parse
+    same = True
+    try:
+        for name, filename, function in PAGES:
+            with open(join(FIXTURES, filename), encoding='utf-8') as f:
+                text = f.read()
+            baseline = None
+            for path_name, path_parse, path_lxml in paths:
+                parse._parse = path_parse
+                parse.lxml_html = path_lxml
+                seconds, result = timed(function, text, args.repeat)
+                if baseline is None:
+                    baseline = (seconds, result)
+                matches = result == baseline[1]
+                same = same and matches
+                print(f'{name:9} {path_name:12} {seconds * 1000:7.2f} ms  x{baseline[0] / seconds:5.1f}'
+                      f'{"" if matches else "  DIFFERENT RESULT"}')
+    finally:
+        parse._parse = real_parse
+        parse.lxml_html = lxml_html
+
+    print('all results match' if same else 'results differ')
+    return 0 if same else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
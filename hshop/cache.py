@@ -0,0 +1,175 @@
+import json
+import sqlite3
+from argparse import ArgumentParser
+from datetime import datetime
+from os import makedirs
+from os.path import dirname, join
+from threading import Lock
+from time import time
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
+
+from utils import get_cache_dir
+
+if TYPE_CHECKING:
+    from typing import Any, Dict, List, Optional
+
+RESPONSE_CACHE_NAME = 'hshop-cache.sqlite3'
+
+# how long a page is used without asking hShop if it changed, by path prefix, in seconds.
+# pages not listed here are always revalidated.
+DEFAULT_TTLS = {
+    '/search/results': 6 * 60 * 60,
+    '/t/': 24 * 60 * 60,
+}
+
+# pages not fetched or revalidated for this long are removed when the cache is opened, in seconds
+MAX_AGE = 30 * 24 * 60 * 60
+
+# returned by get_parsed when nothing was stored, since None can be a parsed result
+MISSING = object()
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    fetched REAL NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    encoding TEXT,
+    body BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS parsed (
+    url TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (url, kind)
+);
+'''
+
+
+def default_response_cache_path():
+    return join(get_cache_dir(), RESPONSE_CACHE_NAME)
+
+
+class CachedPage:
+    __slots__ = ('url', 'fetched', 'etag', 'last_modified', 'encoding', 'body')
+
+    def __init__(self, url: str, fetched: float, etag: 'Optional[str]', last_modified: 'Optional[str]',
+                 encoding: 'Optional[str]', body: bytes):
+        self.url = url
+        self.fetched = fetched
+        self.etag = etag
+        self.last_modified = last_modified
+        self.encoding = encoding
+        self.body = body
+
+
+class ResponseCache:
+    """Pages from hShop and what was parsed from them, kept between runs.
+
+    A parsed result stays valid as long as the page it came from doesn't change, so it's removed when a
+    different version of the page is stored.
+    """
+
+    def __init__(self, path: 'Optional[str]' = None, *, ttls: 'Optional[Dict[str, float]]' = None):
+        self.path = path or default_response_cache_path()
+        self.ttls = DEFAULT_TTLS if ttls is None else ttls
+        self._lock = Lock()
+        makedirs(dirname(self.path), exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.executescript(_SCHEMA)
+        self.prune()
+
+    def ttl(self, url: str) -> float:
+        path = urlsplit(url).path
+        for prefix, ttl in self.ttls.items():
+            if path.startswith(prefix):
+                return ttl
+        return 0
+
+    def is_fresh(self, page: CachedPage):
+        return time() - page.fetched < self.ttl(page.url)
+
+    def get(self, url: str) -> 'Optional[CachedPage]':
+        with self._lock:
+            row = self._db.execute('SELECT url, fetched, etag, last_modified, encoding, body FROM pages WHERE url = ?',
+                                   (url,)).fetchone()
+        return CachedPage(*row) if row else None
+
+    def put(self, url: str, body: bytes, *, etag: 'Optional[str]' = None, last_modified: 'Optional[str]' = None,
+            encoding: 'Optional[str]' = None):
+        with self._lock, self._db:
+            old = self._db.execute('SELECT body FROM pages WHERE url = ?', (url,)).fetchone()
+            if not old or old[0] != body:
+                self._db.execute('DELETE FROM parsed WHERE url = ?', (url,))
+            self._db.execute('INSERT OR REPLACE INTO pages (url, fetched, etag, last_modified, encoding, body) '
+                             'VALUES (?, ?, ?, ?, ?, ?)', (url, time(), etag, last_modified, encoding, body))
+
+    def pages(self) -> 'List[CachedPage]':
+        with self._lock:
+            rows = self._db.execute('SELECT url, fetched, etag, last_modified, encoding, body FROM pages').fetchall()
+        return [CachedPage(*row) for row in rows]
+
+    def touch(self, url: str):
+        """Marks a page as just fetched, after hShop said it didn't change."""
+        with self._lock, self._db:
+            self._db.execute('UPDATE pages SET fetched = ? WHERE url = ?', (time(), url))
+
+    def get_parsed(self, url: str, kind: str) -> 'Any':
+        with self._lock:
+            row = self._db.execute('SELECT data FROM parsed WHERE url = ? AND kind = ?', (url, kind)).fetchone()
+        return json.loads(row[0]) if row else MISSING
+
+    def put_parsed(self, url: str, kind: str, data: 'Any'):
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO parsed (url, kind, data) VALUES (?, ?, ?)',
+                             (url, kind, json.dumps(data)))
+
+    def prune(self, max_age: float = MAX_AGE):
+        with self._lock, self._db:
+            oldest = time() - max_age
+            self._db.execute('DELETE FROM parsed WHERE url IN (SELECT url FROM pages WHERE fetched < ?)', (oldest,))
+            self._db.execute('DELETE FROM pages WHERE fetched < ?', (oldest,))
+
+    def stats(self):
+        with self._lock:
+            pages, size, oldest = self._db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(LENGTH(body)), 0), MIN(fetched) FROM pages').fetchone()
+            parsed = self._db.execute('SELECT COUNT(*) FROM parsed').fetchone()[0]
+            fresh = sum(1 for (url, fetched) in self._db.execute('SELECT url, fetched FROM pages')
+                        if time() - fetched < self.ttl(url))
+        return {'path': self.path, 'pages': pages, 'fresh_pages': fresh, 'parsed': parsed, 'body_bytes': size,
+                'oldest': oldest}
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM parsed')
+            self._db.execute('DELETE FROM pages')
+        with self._lock:
+            self._db.execute('VACUUM')
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Inspect or clear the cache of hShop pages.')
+    parser.add_argument('action', choices=('stats', 'clear'))
+    parser.add_argument('--path', help=f'cache file, defaults to {default_response_cache_path()}')
+    args = parser.parse_args()
+
+    cache = ResponseCache(args.path)
+    if args.action == 'clear':
+        cache.clear()
+        print(f'Cleared {cache.path}')
+    else:
+        stats = cache.stats()
+        print(f'Cache file: {stats["path"]}')
+        print(f'Pages: {stats["pages"]} ({stats["fresh_pages"]} fresh), '
+              f'{stats["body_bytes"] / (1024 * 1024):0.2f} MiB')
+        print(f'Parsed results: {stats["parsed"]}')
+        if stats['oldest']:
+            print(f'Oldest page: {datetime.fromtimestamp(stats["oldest"]):%Y-%m-%d %H:%M}')
+    cache.close()
@@ -0,0 +1,258 @@
+import sqlite3
+from argparse import ArgumentParser
+from dataclasses import asdict
+from os import makedirs
+from os.path import dirname, join
+from threading import Lock
+from time import time
+from typing import TYPE_CHECKING
+from urllib.parse import parse_qs, urlsplit
+
+from hshop.cache import ResponseCache
+from hshop.parse import parse_related_content, parse_search_results, parse_title_search
+from hshop.types import RelatedTitle, SearchResult, Title
+from utils import get_cache_dir
+
+if TYPE_CHECKING:
+    from typing import Iterable, List, Optional
+
+CATALOG_NAME = 'hshop-catalog.sqlite3'
+
+# how long a title ID is mapped to an hShop ID without being seen again, in seconds. after that, it's searched for.
+TITLE_ID_TTL = 7 * 24 * 60 * 60
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS titles (
+    hshop_id TEXT PRIMARY KEY,
+    title_id TEXT,
+    name TEXT,
+    version TEXT,
+    size TEXT,
+    type TEXT,
+    product_code TEXT,
+    category TEXT,
+    region TEXT,
+    seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS titles_title_id ON titles (title_id);
+CREATE TABLE IF NOT EXISTS title_ids (
+    title_id TEXT PRIMARY KEY,
+    hshop_id TEXT NOT NULL,
+    -- 1 if this came from searching hShop for the title ID, 0 if it was seen on some other page
+    searched INTEGER NOT NULL,
+    seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS related_pages (
+    hshop_id TEXT PRIMARY KEY,
+    seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS related (
+    hshop_id TEXT NOT NULL,
+    related_id TEXT NOT NULL,
+    relation_type TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (hshop_id, related_id)
+);
+'''
+
+# in the order of Title's fields
+_TITLE_COLUMNS = ('hshop_id', 'title_id', 'size', 'version', 'type', 'product_code', 'name')
+
+
+def default_catalog_path():
+    return join(get_cache_dir(), CATALOG_NAME)
+
+
+def _normalize_title_id(title_id: 'Optional[str]'):
+    return title_id.strip().upper() if title_id else title_id
+
+
+def is_title_id(text: str):
+    text = text.strip()
+    return len(text) == 16 and all(c in '0123456789abcdefABCDEF' for c in text)
+
+
+class TitleCatalog:
+    """What is known about titles on hShop, filled in from every page that gets parsed.
+
+    This maps title IDs to hShop IDs without searching hShop for them. A title ID is mapped to the result hShop
+    gave when searching for it if there was one, otherwise to the last entry seen with that title ID. A search result
+    is only replaced by other pages once it's older than title_id_ttl, and a mapping that wasn't seen for that long
+    isn't used, so the title ID is searched for again.
+    """
+
+    def __init__(self, path: 'Optional[str]' = None, title_id_ttl: float = TITLE_ID_TTL):
+        self.path = path or default_catalog_path()
+        self.title_id_ttl = title_id_ttl
+        self._lock = Lock()
+        makedirs(dirname(self.path), exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._db:
+            columns = [row[1] for row in self._db.execute('PRAGMA table_info(title_ids)')]
+            if columns and 'seen' not in columns:
+                # from before mappings expired. it's all found again from pages and searches.
+                self._db.execute('DROP TABLE title_ids')
+            self._db.executescript(_SCHEMA)
+
+    def _add_titles(self, titles: 'Iterable[Title]'):
+        # only called with the lock held and in a transaction
+        now = time()
+        for t in titles:
+            if not t.hshop_id:
+                continue
+            title_id = _normalize_title_id(t.title_id)
+            category = getattr(t, 'category', None)
+            region = getattr(t, 'region', None)
+            # related content doesn't say the category or region, so what's known isn't replaced with nothing
+            self._db.execute(
+                'INSERT INTO titles (hshop_id, title_id, name, version, size, type, product_code, category, region, '
+                'seen) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (hshop_id) DO UPDATE SET '
+                'title_id = excluded.title_id, name = excluded.name, version = excluded.version, '
+                'size = excluded.size, type = excluded.type, product_code = excluded.product_code, '
+                'category = COALESCE(excluded.category, category), region = COALESCE(excluded.region, region), '
+                'seen = excluded.seen',
+                (t.hshop_id, title_id, t.name, t.version, t.size, t.type, t.product_code, category, region, now))
+            if title_id:
+                self._db.execute(
+                    'INSERT INTO title_ids (title_id, hshop_id, searched, seen) VALUES (?, ?, 0, ?) '
+                    'ON CONFLICT (title_id) DO UPDATE SET hshop_id = excluded.hshop_id, searched = 0, '
+                    'seen = excluded.seen WHERE NOT title_ids.searched OR title_ids.seen < ?',
+                    (title_id, t.hshop_id, now, now - self.title_id_ttl))
+
+    def add_titles(self, titles: 'Iterable[Title]'):
+        with self._lock, self._db:
+            self._add_titles(titles)
+
+    def add_title_search(self, title_id: str, title: 'Optional[Title]'):
+        """Records the result of searching hShop for a title ID, which is what the title ID maps to from then on."""
+        if title is None:
+            return
+        with self._lock, self._db:
+            self._add_titles([title])
+            self._db.execute(
+                'INSERT OR REPLACE INTO title_ids (title_id, hshop_id, searched, seen) VALUES (?, ?, 1, ?)',
+                (_normalize_title_id(title_id), title.hshop_id, time()))
+
+    def add_related(self, hshop_id: str, related: 'List[RelatedTitle]'):
+        with self._lock, self._db:
+            self._add_titles(related)
+            self._db.execute('INSERT OR REPLACE INTO related_pages (hshop_id, seen) VALUES (?, ?)', (hshop_id, time()))
+            self._db.execute('DELETE FROM related WHERE hshop_id = ?', (hshop_id,))
+            self._db.executemany(
+                'INSERT OR IGNORE INTO related (hshop_id, related_id, relation_type, position) VALUES (?, ?, ?, ?)',
+                [(hshop_id, r.hshop_id, r.relation_type, i) for i, r in enumerate(related) if r.hshop_id])
+
+    def find_title(self, title_id: str) -> 'Optional[Title]':
+        with self._lock:
+            row = self._db.execute(
+                f'SELECT {", ".join(_TITLE_COLUMNS)} FROM titles WHERE hshop_id = '
+                '(SELECT hshop_id FROM title_ids WHERE title_id = ? AND seen >= ?)',
+                (_normalize_title_id(title_id), time() - self.title_id_ttl)).fetchone()
+        return Title(*row) if row else None
+
+    def find_search_result(self, title_id: str) -> 'Optional[SearchResult]':
+        """Returns the title as a search result, if its category and region are known."""
+        with self._lock:
+            row = self._db.execute(
+                f'SELECT {", ".join(_TITLE_COLUMNS)}, category, region FROM titles WHERE hshop_id = '
+                '(SELECT hshop_id FROM title_ids WHERE title_id = ? AND seen >= ?) '
+                'AND category IS NOT NULL AND region IS NOT NULL',
+                (_normalize_title_id(title_id), time() - self.title_id_ttl)).fetchone()
+        return SearchResult(*row) if row else None
+
+    def rebuild(self, cache: 'ResponseCache'):
+        """Fills the catalog again from every page in the response cache. Returns how many pages were used."""
+        self._delete_all()
+        used = 0
+        for page in cache.pages():
+            parts = urlsplit(page.url)
+            text = page.body.decode(page.encoding or 'utf-8', errors='replace')
+            if parts.path.startswith('/search/results'):
+                query = parse_qs(parts.query)
+                if query.get('qt') == ['TitleID'] and query.get('q'):
+                    self.add_title_search(query['q'][0], parse_title_search(text, query['q'][0]))
+                self.add_titles(parse_search_results(text))
+            elif parts.path.startswith('/t/'):
+                self.add_related(parts.path[3:].strip('/'), parse_related_content(text))
+            else:
+                continue
+            used += 1
+        return used
+
+    def stats(self):
+        with self._lock:
+            titles = self._db.execute('SELECT COUNT(*) FROM titles').fetchone()[0]
+            title_ids = self._db.execute('SELECT COUNT(*) FROM title_ids').fetchone()[0]
+            related = self._db.execute('SELECT COUNT(*) FROM related_pages').fetchone()[0]
+        return {'path': self.path, 'titles': titles, 'title_ids': title_ids, 'related_pages': related}
+
+    def _delete_all(self):
+        with self._lock, self._db:
+            for table in ('related', 'related_pages', 'title_ids', 'titles'):
+                self._db.execute(f'DELETE FROM {table}')
+
+    def clear(self):
+        self._delete_all()
+        with self._lock:
+            self._db.execute('VACUUM')
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_catalog: 'Optional[TitleCatalog]' = None
+_catalog_failed = False
+_catalog_lock = Lock()
+
+
+def get_catalog() -> 'Optional[TitleCatalog]':
+    """Returns the shared catalog, or None if it can't be opened."""
+    global _catalog, _catalog_failed
+    with _catalog_lock:
+        if _catalog is None and not _catalog_failed:
+            try:
+                _catalog = TitleCatalog()
+            except (OSError, sqlite3.Error):
+                # everything still works without it, by searching hShop
+                _catalog_failed = True
+        return _catalog
+
+
+def set_catalog(catalog: 'Optional[TitleCatalog]'):
+    """Replaces the shared catalog, or turns it off with None."""
+    global _catalog, _catalog_failed
+    with _catalog_lock:
+        old = _catalog
+        _catalog = catalog
+        _catalog_failed = catalog is None
+    if old and old is not catalog:
+        old.close()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Inspect, rebuild or clear the local catalog of hShop titles.')
+    parser.add_argument('action', choices=('stats', 'lookup', 'rebuild', 'clear'))
+    parser.add_argument('title_ids', nargs='*', help='title IDs to look up')
+    parser.add_argument('--path', help=f'catalog file, defaults to {default_catalog_path()}')
+    parser.add_argument('--cache', help='response cache to rebuild from, defaults to the usual one')
+    args = parser.parse_args()
+
+    catalog = TitleCatalog(args.path)
+    if args.action == 'stats':
+        stats = catalog.stats()
+        print(f'Catalog file: {stats["path"]}')
+        print(f'Titles: {stats["titles"]}, title IDs: {stats["title_ids"]}, '
+              f'titles with related content: {stats["related_pages"]}')
+    elif args.action == 'lookup':
+        for title_id in args.title_ids:
+            title = catalog.find_title(title_id)
+            print(f'{title_id}: {asdict(title) if title else "not in the catalog"}')
+    elif args.action == 'rebuild':
+        cache = ResponseCache(args.cache)
+        print(f'Rebuilt {catalog.path} from {catalog.rebuild(cache)} cached pages')
+        cache.close()
+    else:
+        catalog.clear()
+        print(f'Cleared {catalog.path}')
+    catalog.close()
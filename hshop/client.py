@@ -0,0 +1,195 @@
+import sqlite3
+from threading import Lock
+from time import monotonic, sleep
+from typing import TYPE_CHECKING
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+
+from hshop.cache import MISSING, CachedPage, ResponseCache
+from utils import CI_VERSION
+
+if TYPE_CHECKING:
+    from typing import Any, Callable, Dict, Optional, Tuple, TypeVar, Union
+
+    T = TypeVar('T')
+
+HSHOP_BASE_URL = 'https://hshop.erista.me'
+
+# connect and read timeouts, in seconds
+DEFAULT_TIMEOUT = (10, 30)
+
+# how many times a failed request is tried again, and the backoff factor between tries
+# (the nth retry waits backoff_factor * 2 ** (n - 1) seconds)
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+
+# connections kept open per host
+DEFAULT_POOL_SIZE = 10
+
+# statuses that are worth trying again
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# requests per second sent to one host, and how many can be sent at once before that applies
+DEFAULT_RATE_LIMIT = 5
+DEFAULT_RATE_BURST = 5
+
+
+class HostRateLimiter:
+    """Spaces out requests to each host so there are no more than rate per second, after a burst of burst."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.interval = 1 / rate
+        self.burst = max(burst, 1)
+        self._lock = Lock()
+        self._next: 'Dict[str, float]' = {}
+
+    def wait(self, url: str):
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = monotonic()
+            earliest = now - (self.burst - 1) * self.interval
+            slot = max(self._next.get(host, earliest), earliest)
+            self._next[host] = slot + self.interval
+        if slot > now:
+            sleep(slot - now)
+
+
+class HShopClient:
+    """All requests to hShop go through one of these, so connections are kept alive and reused between them."""
+
+    def __init__(self, *, base_url: str = HSHOP_BASE_URL,
+                 timeout: 'Union[float, Tuple[float, float]]' = DEFAULT_TIMEOUT,
+                 retries: int = DEFAULT_RETRIES, backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+                 pool_size: int = DEFAULT_POOL_SIZE, cache: 'Optional[ResponseCache]' = None,
+                 rate_limit: 'Optional[float]' = DEFAULT_RATE_LIMIT, rate_burst: int = DEFAULT_RATE_BURST):
+        self.base_url = base_url
+        self.timeout = timeout
+        # pages are only requested again once their ttl is over, and then only downloaded if they changed
+        self.cache = cache
+        # pages served from the cache don't count, only what is sent
+        self.rate_limiter = HostRateLimiter(rate_limit, rate_burst) if rate_limit else None
+
+        retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=RETRY_STATUSES,
+                      allowed_methods=frozenset({'GET', 'HEAD'}), respect_retry_after_header=True,
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers['User-Agent'] = f'3ds-title-manager/{CI_VERSION}'
+
+    def url(self, path: str, params=None):
+        url = urljoin(self.base_url, path)
+        if params:
+            url = requests.Request('GET', url, params=params).prepare().url
+        return url
+
+    def get(self, path: str, *, use_cache: bool = True, **kwargs) -> requests.Response:
+        """GETs a path on hShop (or a full URL), with the client's timeout unless one is given.
+
+        Responses that came from the cache (or were revalidated with a 304) have from_cache set.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        if not (self.cache and use_cache) or kwargs.get('stream'):
+            self._wait(self.url(path))
+            response = self.session.get(self.url(path), **kwargs)
+            response.from_cache = False
+            return response
+
+        url = self.url(path, kwargs.pop('params', None))
+        page = self.cache.get(url)
+        if page and self.cache.is_fresh(page):
+            return self._cached_response(page)
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        if page and page.etag:
+            headers['If-None-Match'] = page.etag
+        if page and page.last_modified:
+            headers['If-Modified-Since'] = page.last_modified
+        self._wait(url)
+        response = self.session.get(url, headers=headers, **kwargs)
+
+        if page and response.status_code == 304:
+            self.cache.touch(url)
+            return self._cached_response(page)
+        if response.status_code == 200:
+            self.cache.put(url, response.content, etag=response.headers.get('ETag'),
+                           last_modified=response.headers.get('Last-Modified'), encoding=response.encoding)
+        response.from_cache = False
+        return response
+
+    def get_parsed(self, path: str, kind: str, parse: 'Callable[[str], T]', *, params=None,
+                   dump: 'Callable[[T], Any]' = lambda x: x, load: 'Callable[[Any], T]' = lambda x: x) -> 'T':
+        """GETs a page and returns parse(page text).
+
+        If the page didn't change since it was last parsed as kind, the stored result is used, through dump and load
+        so it can be kept as JSON.
+        """
+        response = self.get(path, params=params)
+        url = self.url(path, params)
+        if self.cache and response.from_cache:
+            data = self.cache.get_parsed(url, kind)
+            if data is not MISSING:
+                return load(data)
+
+        result = parse(response.text)
+        if self.cache and response.status_code == 200:
+            self.cache.put_parsed(url, kind, dump(result))
+        return result
+
+    @staticmethod
+    def _cached_response(page: CachedPage):
+        response = requests.Response()
+        response.status_code = 200
+        response.url = page.url
+        response._content = page.body
+        response.encoding = page.encoding
+        response.headers = CaseInsensitiveDict()
+        response.from_cache = True
+        return response
+
+    def head(self, path: str, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+        self._wait(self.url(path))
+        return self.session.head(self.url(path), **kwargs)
+
+    def _wait(self, url: str):
+        if self.rate_limiter:
+            self.rate_limiter.wait(url)
+
+    def close(self):
+        self.session.close()
+
+
+_client: 'Optional[HShopClient]' = None
+_client_lock = Lock()
+
+
+def get_client():
+    """Returns the client shared by everything talking to hShop."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            try:
+                cache = ResponseCache()
+            except (OSError, sqlite3.Error):
+                # not being able to cache pages isn't a reason to stop anything
+                cache = None
+            _client = HShopClient(cache=cache)
+        return _client
+
+
+def configure_client(**kwargs):
+    """Replaces the shared client with one made with these arguments for HShopClient."""
+    global _client
+    with _client_lock:
+        old = _client
+        _client = HShopClient(**kwargs)
+    if old:
+        old.close()
+    return _client
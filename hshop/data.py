@@ -1,69 +1,113 @@
-import requests
-from bs4 import BeautifulSoup
-
-from hshop.parse import _compile_meta_node
-from hshop.types import RelatedTitle, Title
-
-
-def find_hshop_title(title_id: str):
-    text = requests.get(
-        f'https://hshop.erista.me/search/results?q={title_id}&qt=TitleID').text
-    bsoup = BeautifulSoup(text, 'html.parser')
-    all_metas = bsoup.find_all(name='a', attrs={
-        'class': 'list-entry block-link'})
-    if all_metas is None or len(all_metas) == 0:
-        return None
-    meta_section = all_metas[0]
-    meta = _compile_meta_node(meta_section)
-    title = meta_section.find_all(
-        name='h3', attrs={'class': 'green bold nospace'})[0].text
-    if meta.title_id != title_id:
-        return None
-    return Title(meta.hshop_id, meta.title_id, meta.size, meta.version, meta.type, meta.product_code, title)
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import asdict
+from email.message import Message
+from typing import TYPE_CHECKING
 
+from hshop.catalog import get_catalog, is_title_id
+from hshop.client import get_client
+from hshop.parse import (parse_download_url, parse_related_content,
+                         parse_search_results, parse_title_search)
+from hshop.types import RelatedTitle, SearchResult, Title
 
-def get_related_content(hshop_id: str) -> list[RelatedTitle]:
-    text = requests.get(f'https://hshop.erista.me/t/' + hshop_id).text
-    bsoup = BeautifulSoup(text, 'html.parser')
-    rc = related_content = bsoup.find_all(name='div', class_='related')
-    if rc is None or len(rc) == 0:
-        return []
-    related_content = rc[0]
-    results = []
-    for related_item in related_content.find_all(name='a', class_='list-entry'):
-        name = related_item.find_all(
-            name='h3', class_='green bold nospace')[0].text
-
-        meta_blocks = related_item.find_all(name='div', class_='meta')
-
-        relation_type = related_item.find_all(
-            name='span', class_='bold')[0].text.replace('Relation: ', '')
-        meta_info = _compile_meta_node(meta_blocks[1])
-        relation = RelatedTitle(meta_info.hshop_id, meta_info.title_id, meta_info.size,
-                                meta_info.version, meta_info.type, meta_info.product_code, name, relation_type)
-        results.append(relation)
+if TYPE_CHECKING:
+    from typing import Dict, List, Mapping, Optional, Tuple
+
+# pages fetched at once when following related content
+CRAWL_WORKERS = 8
+
+
+def find_hshop_title(title_id: str, *, use_catalog: bool = True):
+    """Returns the hShop title with this title ID, from the catalog if it's there, otherwise by searching hShop."""
+    catalog = get_catalog()
+    if catalog and use_catalog:
+        title = catalog.find_title(title_id)
+        if title:
+            return title
+
+    title = get_client().get_parsed('/search/results', 'title', lambda text: parse_title_search(text, title_id),
+                                    params={'q': title_id, 'qt': 'TitleID'},
+                                    dump=lambda t: t and asdict(t), load=lambda d: d and Title(**d))
+    if catalog:
+        catalog.add_title_search(title_id, title)
+    return title
+
+
+def search_hshop(query: str) -> list[SearchResult]:
+    """Searches hShop by text, most downloaded first. A title ID that's in the catalog is looked up there."""
+    catalog = get_catalog()
+    if catalog and is_title_id(query):
+        result = catalog.find_search_result(query)
+        if result:
+            return [result]
+
+    results = get_client().get_parsed('/search/results', 'search', parse_search_results,
+                                      params={'sd': 'descending', 'sb': 'downloads', 'q': query, 'qt': 'Text',
+                                              'lgy': 'false'},
+                                      dump=lambda rs: [asdict(r) for r in rs],
+                                      load=lambda ds: [SearchResult(**d) for d in ds])
+    if catalog:
+        catalog.add_titles(results)
     return results
 
 
-def find_all_linked_content(hshop_id: str, seen=[]) -> list[RelatedTitle]:
-    related_content = get_related_content(hshop_id)
+def get_related_content(hshop_id: str) -> list[RelatedTitle]:
+    related = get_client().get_parsed('/t/' + hshop_id, 'related', parse_related_content,
+                                      dump=lambda ts: [asdict(t) for t in ts],
+                                      load=lambda ds: [RelatedTitle(**d) for d in ds])
+    catalog = get_catalog()
+    if catalog:
+        catalog.add_related(hshop_id, related)
+    return related
+
+
+def crawl_related_content(hshop_id: str, max_workers: int = CRAWL_WORKERS) -> 'Dict[str, List[RelatedTitle]]':
+    """Fetches the related content of hshop_id and of everything linked from it, except base titles.
+
+    Pages are fetched breadth first, up to max_workers at a time, and each one only once.
+    Returns the related content of every page that was fetched, by hShop ID.
+    """
+    related: 'Dict[str, List[RelatedTitle]]' = {}
+    queued = {hshop_id}
+    executor = ThreadPoolExecutor(max_workers)
+    try:
+        pending = {executor.submit(get_related_content, hshop_id): hshop_id}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = pending.pop(future)
+                related[node] = future.result()
+                for r in related[node]:
+                    if r.relation_type != 'Base Title' and r.hshop_id not in queued:
+                        queued.add(r.hshop_id)
+                        pending[executor.submit(get_related_content, r.hshop_id)] = r.hshop_id
+    finally:
+        executor.shutdown(cancel_futures=True)
+    return related
 
-    results = []
-    for r in related_content:
-        if r.relation_type == 'Base Title':
-            continue
-        results.append(r)
-        if r.hshop_id not in seen:
-            seen.append(r.hshop_id)
-            results.extend(find_all_linked_content(
-                r.hshop_id, seen))
 
+def find_all_linked_content(hshop_id: str) -> list[RelatedTitle]:
+    related = crawl_related_content(hshop_id)
+
+    # everything was fetched already, this only puts it in the same order as following the links one at a time
     seen = set()
+
+    def walk(node: str):
+        results = []
+        for r in related[node]:
+            if r.relation_type == 'Base Title':
+                continue
+            results.append(r)
+            if r.hshop_id not in seen:
+                seen.add(r.hshop_id)
+                results.extend(walk(r.hshop_id))
+        return results
+
+    seen_ids = set()
     final_results = []
-    for x in results:
-        if x.hshop_id not in seen:
+    for x in walk(hshop_id):
+        if x.hshop_id not in seen_ids:
             final_results.append(x)
-            seen.add(x.hshop_id)
+            seen_ids.add(x.hshop_id)
     return final_results
 
 
@@ -71,3 +115,27 @@ def find_candidate_linked_content(hshop_id: str) -> list[RelatedTitle]:
     related_content = find_all_linked_content(hshop_id)
     DESIRED_TYPES = ['Downloadable Content', 'Update Data']
     return [x for x in related_content if x.relation_type in DESIRED_TYPES]
+
+
+def get_download_url(hshop_id: str) -> str:
+    # the link can expire, so this always comes from a fresh page
+    return parse_download_url(get_client().get('/t/' + hshop_id, use_cache=False).text)
+
+
+def filename_from_headers(headers: 'Mapping[str, str]') -> str:
+    # hShop's Content-Disposition header is non-standard, so it's parsed with the email module
+    # instead of relying on the downloader to understand it.
+    msg = Message()
+    msg['content-disposition'] = headers['Content-Disposition']
+    return msg.get_filename()
+
+
+def get_download_info(download_url: str) -> 'Tuple[str, Optional[int]]':
+    """Returns the filename of a download, and its size if the server says."""
+    response = get_client().head(download_url, allow_redirects=True)
+    size = response.headers.get('Content-Length')
+    return filename_from_headers(response.headers), int(size) if size else None
+
+
+def get_download_filename(download_url: str) -> str:
+    return get_download_info(download_url)[0]
@@ -0,0 +1,512 @@
+import sqlite3
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from enum import Enum
+from hashlib import sha256
+from os import fsync, makedirs, remove, replace
+from os.path import getsize, isfile, join
+from threading import BoundedSemaphore, Event, Lock
+from time import monotonic, sleep
+from typing import TYPE_CHECKING
+
+from pyctr.crypto import BootromNotFoundError, KeyslotMissingError
+
+from hshop.client import get_client
+from hshop.data import get_download_info, get_download_url
+from installer.growingfile import GrowingFile
+from installer.verify import verify_cia
+
+if TYPE_CHECKING:
+    from queue import Queue
+    from typing import BinaryIO, Callable, Deque, Dict, List, Optional, Tuple
+
+    from hshop.ledger import DownloadLedger, LedgerEntry
+
+DOWNLOAD_DIR = 'downloads'
+
+# files downloaded at the same time
+DEFAULT_TRANSFERS = 3
+
+# download links found ahead of the transfers, so the next file starts as soon as one finishes.
+# links can expire, so this isn't the whole queue.
+DEFAULT_PREFETCH = 2
+
+# pages and headers fetched at the same time to find download links
+RESOLVE_WORKERS = 2
+
+# downloads checked against their TMD at the same time. this is mostly decrypting and hashing, which doesn't hold the
+# GIL, so each one gets a core.
+VERIFY_WORKERS = 2
+
+# times a title is downloaded before it's given up on as corrupted
+VERIFY_ATTEMPTS = 3
+
+# how much is read from a response at once, in bytes
+CHUNK_SIZE = 256 * 1024
+
+# bytes downloaded between updates to the ledger, which also flush the file to the disk
+LEDGER_CHECKPOINT = 8 * 1024 * 1024
+
+# how often progress is sampled while downloading, in seconds
+PROGRESS_INTERVAL = 0.1
+
+# speeds are averaged over this long, in seconds
+SPEED_WINDOW = 3
+
+
+class DownloadStatus(Enum):
+    Queued = 0
+    Resolving = 1
+    Waiting = 2
+    Downloading = 3
+    Done = 4
+    Failed = 5
+    Cancelled = 6
+    Verifying = 7
+
+
+@dataclass
+class DownloadItem:
+    hshop_id: str
+    name: str
+    status: DownloadStatus = DownloadStatus.Queued
+    url: 'Optional[str]' = None
+    filename: 'Optional[str]' = None
+    path: 'Optional[str]' = None
+    # None until the server says
+    size: 'Optional[int]' = None
+    downloaded: int = 0
+    started: 'Optional[float]' = None
+    finished: 'Optional[float]' = None
+    error: 'Optional[str]' = None
+    # bytes per second over the last SPEED_WINDOW seconds, updated when progress is sampled
+    speed: float = 0.0
+    # when streaming, the file can be read from here while it downloads
+    stream: 'Optional[GrowingFile]' = None
+    # bytes that were already downloaded by an earlier run, all of them if the file was still complete
+    resumed: int = 0
+    # bytes of content checked against the TMD so far
+    verified: int = 0
+    # how many times it was downloaded in this run, more than once if it was corrupted
+    attempts: int = 0
+    # hex SHA-256 of the whole file, kept until it's verified and can go in the ledger
+    sha256: 'Optional[str]' = None
+
+
+@dataclass(frozen=True)
+class ItemProgress:
+    hshop_id: str
+    status: DownloadStatus
+    downloaded: int
+    size: 'Optional[int]'
+    speed: float
+    verified: int = 0
+
+
+@dataclass(frozen=True)
+class DownloadProgress:
+    """A copy of the state of every item, taken every PROGRESS_INTERVAL seconds."""
+    items: 'Tuple[ItemProgress, ...]'
+    # true for the last one, once every item is done, failed or cancelled
+    finished: bool = False
+
+    @property
+    def done(self):
+        return sum(1 for i in self.items if i.status == DownloadStatus.Done)
+
+    @property
+    def speed(self):
+        return sum(i.speed for i in self.items if i.status == DownloadStatus.Downloading)
+
+    @property
+    def verify_speed(self):
+        return sum(i.speed for i in self.items if i.status == DownloadStatus.Verifying)
+
+
+def file_sha256(path: str, size: 'Optional[int]' = None, hasher=None) -> str:
+    """Hashes the first size bytes of a file (all of it if size is None), adding to hasher if one is given."""
+    hasher = hasher or sha256()
+    left = size
+    with open(path, 'rb') as f:
+        while left is None or left > 0:
+            data = f.read(CHUNK_SIZE if left is None else min(CHUNK_SIZE, left))
+            if not data:
+                break
+            hasher.update(data)
+            if left is not None:
+                left -= len(data)
+    return hasher.hexdigest()
+
+
+class BandwidthLimiter:
+    """Shares a number of bytes per second between every transfer."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._lock = Lock()
+        self._next = monotonic()
+
+    def consume(self, size: int):
+        with self._lock:
+            now = monotonic()
+            # a limiter that was idle doesn't save up for a burst
+            start = max(self._next, now)
+            self._next = start + size / self.rate
+        if start > now:
+            sleep(start - now)
+
+
+class DownloadManager:
+    """Downloads hShop titles, several at a time.
+
+    Download links are found up to prefetch items ahead of the transfers. max_bandwidth (bytes per second, None for
+    no limit) is shared between every transfer. At most max_transfers + RESOLVE_WORKERS connections are open at once,
+    all from the shared client's pool.
+
+    With stream, every item gets a GrowingFile as soon as it's added, which can be read while the item downloads. Its
+    file is only moved to item.path (or removed, without keep_files) once the stream is closed too.
+
+    With a ledger, files that were downloaded before and still match their hash aren't downloaded again, downloads
+    that were stopped continue where they were, and finished items are taken off the ledger's queue.
+
+    With verify, every content of a downloaded CIA is checked against its TMD before the file is moved out of its
+    .part, and corrupted files are downloaded again, up to VERIFY_ATTEMPTS times. This needs the boot9 keys to be set
+    up. Streamed titles aren't checked here, since the installer checks them as it reads them.
+    """
+
+    def __init__(self, directory: str = DOWNLOAD_DIR, *, max_transfers: int = DEFAULT_TRANSFERS,
+                 prefetch: int = DEFAULT_PREFETCH, max_bandwidth: 'Optional[float]' = None,
+                 chunk_size: int = CHUNK_SIZE, stream: bool = False, keep_files: bool = True,
+                 ledger: 'Optional[DownloadLedger]' = None, verify: bool = False):
+        self.directory = directory
+        self.ledger = ledger
+        self.verify = verify and not stream
+        self.max_transfers = max_transfers
+        self.chunk_size = chunk_size
+        self.stream = stream
+        self.keep_files = keep_files
+        self.limiter = BandwidthLimiter(max_bandwidth) if max_bandwidth else None
+        self.items: 'List[DownloadItem]' = []
+        self._cancelled = Event()
+        # held from when an item's link is found until its transfer is over
+        self._slots = BoundedSemaphore(max_transfers + prefetch)
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def add(self, hshop_id: str, name: str) -> DownloadItem:
+        item = DownloadItem(hshop_id, name)
+        if self.stream:
+            item.stream = GrowingFile(on_release=lambda path, complete: self._release(item, path, complete))
+        self.items.append(item)
+        return item
+
+    def _release(self, item: DownloadItem, part_path: 'Optional[str]', complete: bool):
+        # the stream's file isn't open anywhere now, so it can be moved
+        if part_path is None or (complete and part_path == item.path):
+            # or it was already there from an earlier download
+            return
+        try:
+            if complete and self.keep_files:
+                replace(part_path, item.path)
+            elif self.keep_files and self.ledger:
+                # left to be continued by the next download
+                pass
+            else:
+                remove(part_path)
+                if self.ledger:
+                    self.ledger.forget(item.filename)
+        except OSError as e:
+            # this can happen on the installer's thread, which shouldn't fail over a leftover file
+            item.error = f'Could not move the download: {type(e).__name__}: {e}'
+
+    def _stream_failed(self, item: DownloadItem):
+        if item.stream:
+            item.stream.fail(item.error or item.status.name)
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _resolve(self, item: DownloadItem):
+        self._slots.acquire()
+        if self.cancelled:
+            self._slots.release()
+            return
+        try:
+            item.status = DownloadStatus.Resolving
+            item.url = get_download_url(item.hshop_id)
+            item.filename, item.size = get_download_info(item.url)
+            item.path = join(self.directory, item.filename)
+            item.status = DownloadStatus.Waiting
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _transfer(self, item: DownloadItem, resolved: 'Future'):
+        try:
+            resolved.result()
+        except Exception as e:
+            item.status = DownloadStatus.Failed
+            item.error = f'Could not find the download: {type(e).__name__}: {e}'
+            self._stream_failed(item)
+            return
+        if item.status != DownloadStatus.Waiting:
+            item.status = DownloadStatus.Cancelled
+            self._stream_failed(item)
+            return
+
+        try:
+            if self.cancelled:
+                item.status = DownloadStatus.Cancelled
+                return
+            self._download(item)
+        except Exception as e:
+            item.status = DownloadStatus.Failed
+            item.error = f'{type(e).__name__}: {e}'
+        finally:
+            self._slots.release()
+            if item.status != DownloadStatus.Done:
+                self._stream_failed(item)
+
+    def _still_verifies(self, item: DownloadItem, entry: 'LedgerEntry'):
+        return (entry.complete and entry.size == item.size and isfile(item.path) and getsize(item.path) == item.size
+                and file_sha256(item.path) == entry.sha256)
+
+    def _download(self, item: DownloadItem):
+        item.started = monotonic()
+        item.attempts += 1
+        # written next to where it goes, so a file in the download directory is always complete
+        part_path = item.path + '.part'
+        entry = self.ledger.get(item.filename) if self.ledger else None
+        if entry and self._still_verifies(item, entry):
+            item.downloaded = item.resumed = item.size
+            item.finished = monotonic()
+            item.status = DownloadStatus.Done
+            if self.ledger:
+                self.ledger.dequeue(item.hshop_id)
+            if item.stream:
+                item.stream.begin(item.path, item.size)
+                item.stream.extend(item.size)
+                item.stream.finish()
+            return
+
+        # a download that was stopped continues from the end of what was written in one piece
+        start = 0
+        if entry and not entry.complete and entry.size == item.size and isfile(part_path):
+            start = min(entry.contiguous, getsize(part_path))
+            if item.size:
+                # asking for an empty range is an error, so a file that was all written still gets its last byte
+                start = min(start, item.size - 1)
+        if self.ledger:
+            self.ledger.begin(item.filename, item.hshop_id, item.url, item.size)
+            if not start:
+                self.ledger.reset(item.filename)
+        hasher = sha256()
+        if start:
+            # the hash is of the whole file, so it has to start with what is already there
+            file_sha256(part_path, start, hasher)
+
+        item.downloaded = item.resumed = start
+        item.status = DownloadStatus.Downloading
+        headers = {'Range': f'bytes={start}-'} if start else None
+        # without a ledger, nothing would know where to continue from, so partial files are removed
+        keep_partial = self.ledger is not None or item.stream is not None
+        try:
+            with get_client().get(item.url, stream=True, use_cache=False, headers=headers) as response:
+                response.raise_for_status()
+                if start and response.status_code != 206:
+                    # the server ignored the range and sent all of it
+                    start = item.downloaded = item.resumed = 0
+                    hasher = sha256()
+                    self.ledger.reset(item.filename)
+                if response.headers.get('Content-Length'):
+                    item.size = start + int(response.headers['Content-Length'])
+                with open(part_path, 'r+b' if start else 'wb') as o:
+                    o.seek(start)
+                    o.truncate()
+                    if item.stream:
+                        item.stream.begin(part_path, item.size)
+                        item.stream.extend(start)
+                    checkpoint = start
+                    try:
+                        for chunk in response.iter_content(self.chunk_size):
+                            if self.cancelled:
+                                break
+                            if self.limiter:
+                                self.limiter.consume(len(chunk))
+                            o.write(chunk)
+                            hasher.update(chunk)
+                            item.downloaded += len(chunk)
+                            if item.stream:
+                                # it's read through another file object, which only sees what was flushed
+                                o.flush()
+                                item.stream.extend(item.downloaded)
+                            if self.ledger and item.downloaded - checkpoint >= LEDGER_CHECKPOINT:
+                                self._checkpoint(item, o, checkpoint)
+                                checkpoint = item.downloaded
+                    finally:
+                        if self.ledger:
+                            self._checkpoint(item, o, checkpoint)
+
+            item.finished = monotonic()
+            if self.cancelled:
+                item.status = DownloadStatus.Cancelled
+                if not keep_partial:
+                    remove(part_path)
+                return
+            if item.size is not None and item.downloaded != item.size:
+                raise IOError(f'Download ended early, got {item.downloaded} of {item.size} bytes')
+        except BaseException:
+            if not keep_partial and isfile(part_path):
+                remove(part_path)
+            raise
+        item.sha256 = hasher.hexdigest()
+        if self.verify:
+            # it only goes in the ledger as complete, or next to the other downloads, once it's verified
+            item.status = DownloadStatus.Verifying
+            return
+        if self.ledger:
+            self.ledger.finish(item.filename, item.sha256)
+            self.ledger.dequeue(item.hshop_id)
+        item.status = DownloadStatus.Done
+        if item.stream:
+            # moved once whatever reads the stream is done with it
+            item.stream.finish()
+        else:
+            replace(part_path, item.path)
+
+    def _checkpoint(self, item: DownloadItem, o: 'BinaryIO', start: int):
+        # only what is really on the disk is recorded, so a crash can't leave a hole that the ledger says is written
+        o.flush()
+        fsync(o.fileno())
+        self.ledger.add_range(item.filename, start, item.downloaded)
+
+    def _verify(self, item: DownloadItem):
+        part_path = item.path + '.part'
+        if self.cancelled:
+            # the .part is still there for the next download to check
+            item.status = DownloadStatus.Cancelled
+            return
+
+        def on_progress(verified: int):
+            item.verified = verified
+
+        item.verified = 0
+        try:
+            result = verify_cia(part_path, on_progress)
+        except (KeyslotMissingError, BootromNotFoundError) as e:
+            item.status = DownloadStatus.Failed
+            item.error = f'Could not verify the download: {type(e).__name__}: {e}'
+            return
+        except Exception as e:
+            item.status = DownloadStatus.Failed
+            item.error = f'{type(e).__name__}: {e}'
+            return
+
+        try:
+            if result.ok:
+                replace(part_path, item.path)
+                if self.ledger:
+                    self.ledger.finish(item.filename, item.sha256)
+                    self.ledger.dequeue(item.hshop_id)
+                item.status = DownloadStatus.Done
+                return
+
+            remove(part_path)
+            if self.ledger:
+                self.ledger.forget(item.filename)
+        except (OSError, sqlite3.Error) as e:
+            item.status = DownloadStatus.Failed
+            item.error = f'Could not {"keep" if result.ok else "remove"} the download: {type(e).__name__}: {e}'
+            return
+        item.error = result.error or f'Content {", ".join(result.bad_contents)} does not match the TMD'
+        if item.attempts < VERIFY_ATTEMPTS and not self.cancelled:
+            # downloaded again from the end of the queue
+            item.status = DownloadStatus.Queued
+        else:
+            item.status = DownloadStatus.Failed
+            item.error = f'Corrupted after {item.attempts} downloads: {item.error}'
+
+    def _sample(self, history: 'Dict[str, Tuple[DownloadStatus, Deque[Tuple[float, int]]]]',
+                finished: bool = False) -> DownloadProgress:
+        now = monotonic()
+        for item in self.items:
+            status, samples = history.get(item.hshop_id, (None, None))
+            if status != item.status:
+                # downloading and verifying count different bytes
+                samples = deque()
+                history[item.hshop_id] = (item.status, samples)
+            if item.status == DownloadStatus.Downloading:
+                count = item.downloaded
+            elif item.status == DownloadStatus.Verifying:
+                count = item.verified
+            else:
+                item.speed = 0.0
+                continue
+            samples.append((now, count))
+            while now - samples[0][0] > SPEED_WINDOW:
+                samples.popleft()
+            t0, b0 = samples[0]
+            item.speed = (count - b0) / (now - t0) if now > t0 else 0.0
+        return DownloadProgress(tuple(ItemProgress(i.hshop_id, i.status, i.downloaded, i.size, i.speed, i.verified)
+                                      for i in self.items), finished)
+
+    def run(self, progress: 'Optional[Queue[DownloadProgress]]' = None,
+            on_item_finished: 'Optional[Callable[[DownloadItem], None]]' = None) -> 'List[DownloadItem]':
+        """Downloads every item that was added, returning them once they are all done, failed or cancelled.
+
+        If progress is given, a DownloadProgress is put in it every PROGRESS_INTERVAL seconds, and one with finished set
+        at the end. on_item_finished is called from the thread running this after each item.
+        """
+        items = [i for i in self.items if i.status == DownloadStatus.Queued]
+        history = {}
+        try:
+            makedirs(self.directory, exist_ok=True)
+            with ThreadPoolExecutor(RESOLVE_WORKERS) as resolvers, \
+                    ThreadPoolExecutor(self.max_transfers) as transfers, \
+                    ThreadPoolExecutor(VERIFY_WORKERS) as verifiers:
+                def download(item: DownloadItem) -> 'Future':
+                    # both run in queue order, so the links found are always the ones needed next
+                    return transfers.submit(self._transfer, item, resolvers.submit(self._resolve, item))
+
+                # the item each future is working on, and whether it's verifying it, to know what it goes to next
+                pending: 'Dict[Future, Tuple[DownloadItem, bool]]' = {download(item): (item, False) for item in items}
+
+                # this sleeps until something ends or it's time for another sample
+                while pending:
+                    done, _ = wait(pending, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        item, verified = pending.pop(future)
+                        error = future.exception()
+                        if error or (verified and item.status == DownloadStatus.Verifying):
+                            # anything that went this wrong is given up on, not tried again forever
+                            item.status = DownloadStatus.Failed
+                            if error:
+                                item.error = f'{type(error).__name__}: {error}'
+                            elif not item.error:
+                                item.error = 'Verification ended without a result'
+                        if item.status == DownloadStatus.Verifying:
+                            # verified apart from the transfers, so the next download doesn't wait for it
+                            pending[verifiers.submit(self._verify, item)] = (item, True)
+                        elif item.status == DownloadStatus.Queued:
+                            # it was corrupted, and a new link is found for it in case the old one expired
+                            pending[download(item)] = (item, False)
+                        elif on_item_finished:
+                            on_item_finished(item)
+                    if progress is not None:
+                        progress.put(self._sample(history))
+        finally:
+            # sent even if something went wrong, so whatever is waiting on it doesn't wait forever
+            if progress is not None:
+                progress.put(self._sample(history, finished=True))
+        return self.items
+
+    def start(self, progress: 'Optional[Queue[DownloadProgress]]' = None,
+              on_item_finished: 'Optional[Callable[[DownloadItem], None]]' = None) -> 'Future[List[DownloadItem]]':
+        """Runs the downloads on their own thread. The future's result is the items, like run."""
+        executor = ThreadPoolExecutor(1)
+        future = executor.submit(self.run, progress, on_item_finished)
+        executor.shutdown(wait=False)
+        return future
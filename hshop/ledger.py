@@ -0,0 +1,166 @@
+import sqlite3
+from dataclasses import dataclass
+from os import makedirs
+from os.path import abspath, dirname, join
+from threading import Lock
+from time import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Iterable, List, Optional, Tuple
+
+LEDGER_NAME = 'downloads.sqlite3'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS queue (
+    hshop_id TEXT PRIMARY KEY,
+    title_id TEXT,
+    name TEXT,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    filename TEXT PRIMARY KEY,
+    hshop_id TEXT NOT NULL,
+    url TEXT,
+    size INTEGER,
+    sha256 TEXT,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ranges (
+    filename TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    PRIMARY KEY (filename, start)
+);
+'''
+
+
+def default_ledger_path(directory: str):
+    return join(directory, LEDGER_NAME)
+
+
+@dataclass
+class LedgerEntry:
+    filename: str
+    hshop_id: str
+    url: 'Optional[str]'
+    size: 'Optional[int]'
+    # parts of the .part file known to be written, as (start, end) with end exclusive, sorted and not overlapping
+    ranges: 'List[Tuple[int, int]]'
+    # hex SHA-256 of the whole file, only set once it's complete
+    sha256: 'Optional[str]' = None
+
+    @property
+    def complete(self):
+        return self.sha256 is not None
+
+    @property
+    def contiguous(self):
+        """How many bytes from the start of the file are written, which is where a download can continue from."""
+        if self.ranges and self.ranges[0][0] == 0:
+            return self.ranges[0][1]
+        return 0
+
+
+def merge_ranges(ranges: 'Iterable[Tuple[int, int]]') -> 'List[Tuple[int, int]]':
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class DownloadLedger:
+    """What was downloaded into a directory, and what was still queued, kept between runs.
+
+    Files are known by the name hShop gives them in Content-Disposition, and are only trusted as complete while they
+    still match the hash recorded when they finished. The queue is kept separately by hShop ID, since a title's file
+    name isn't known until its download link is found.
+    """
+
+    def __init__(self, path: str):
+        self.path = abspath(path)
+        self._lock = Lock()
+        makedirs(dirname(self.path), exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.executescript(_SCHEMA)
+
+    def set_queue(self, items: 'Iterable[Tuple[str, Optional[str], Optional[str]]]'):
+        """Replaces the queue with these (hShop ID, title ID, name), in order."""
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM queue')
+            self._db.executemany('INSERT OR IGNORE INTO queue (hshop_id, title_id, name, position) VALUES (?, ?, ?, ?)',
+                                 [(hshop_id, title_id, name, i) for i, (hshop_id, title_id, name) in enumerate(items)])
+
+    def queued(self) -> 'List[Tuple[str, Optional[str], Optional[str]]]':
+        with self._lock:
+            return self._db.execute('SELECT hshop_id, title_id, name FROM queue ORDER BY position').fetchall()
+
+    def dequeue(self, hshop_id: str):
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM queue WHERE hshop_id = ?', (hshop_id,))
+
+    def get(self, filename: str) -> 'Optional[LedgerEntry]':
+        with self._lock:
+            row = self._db.execute('SELECT filename, hshop_id, url, size, sha256 FROM files WHERE filename = ?',
+                                   (filename,)).fetchone()
+            if not row:
+                return None
+            ranges = self._db.execute('SELECT start, end FROM ranges WHERE filename = ? ORDER BY start',
+                                      (filename,)).fetchall()
+        filename, hshop_id, url, size, sha256 = row
+        return LedgerEntry(filename, hshop_id, url, size, [tuple(r) for r in ranges], sha256)
+
+    def begin(self, filename: str, hshop_id: str, url: str, size: 'Optional[int]'):
+        """Records a download that is starting. What was written before is forgotten if the size changed."""
+        with self._lock, self._db:
+            row = self._db.execute('SELECT size FROM files WHERE filename = ?', (filename,)).fetchone()
+            if row and row[0] != size:
+                self._db.execute('DELETE FROM ranges WHERE filename = ?', (filename,))
+            self._db.execute(
+                'INSERT INTO files (filename, hshop_id, url, size, sha256, updated) VALUES (?, ?, ?, ?, NULL, ?) '
+                'ON CONFLICT (filename) DO UPDATE SET hshop_id = excluded.hshop_id, url = excluded.url, '
+                'size = excluded.size, sha256 = NULL, updated = excluded.updated',
+                (filename, hshop_id, url, size, time()))
+
+    def add_range(self, filename: str, start: int, end: int):
+        """Records that start to end (exclusive) of the file is written, and flushed to the disk."""
+        if end <= start:
+            return
+        with self._lock, self._db:
+            ranges = self._db.execute('SELECT start, end FROM ranges WHERE filename = ?', (filename,)).fetchall()
+            self._db.execute('DELETE FROM ranges WHERE filename = ?', (filename,))
+            self._db.executemany('INSERT INTO ranges (filename, start, end) VALUES (?, ?, ?)',
+                                 [(filename, s, e) for s, e in merge_ranges(ranges + [(start, end)])])
+            self._db.execute('UPDATE files SET updated = ? WHERE filename = ?', (time(), filename))
+
+    def reset(self, filename: str):
+        """Forgets what was written of a file, when it has to be downloaded from the start again."""
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM ranges WHERE filename = ?', (filename,))
+            self._db.execute('UPDATE files SET sha256 = NULL, updated = ? WHERE filename = ?', (time(), filename))
+
+    def finish(self, filename: str, sha256: str):
+        with self._lock, self._db:
+            self._db.execute('UPDATE files SET sha256 = ?, updated = ? WHERE filename = ?', (sha256, time(), filename))
+
+    def forget(self, filename: str):
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM ranges WHERE filename = ?', (filename,))
+            self._db.execute('DELETE FROM files WHERE filename = ?', (filename,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def open_ledger(directory: str) -> 'Optional[DownloadLedger]':
+    """Opens the ledger of a download directory, or returns None if it can't be opened."""
+    try:
+        return DownloadLedger(default_ledger_path(directory))
+    except (OSError, sqlite3.Error):
+        # downloads still work without it, they just can't be continued
+        return None
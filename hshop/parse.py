@@ -1,6 +1,41 @@
-from bs4 import PageElement
+from bs4 import BeautifulSoup, PageElement, SoupStrainer
 
-from hshop.types import TitleMeta
+from hshop.types import RelatedTitle, SearchResult, Title, TitleMeta
+
+# lxml is a lot faster, but it's optional
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+except ImportError:
+    lxml_html = None
+
+
+def _has_class(name: str):
+    # a strainer sees the whole class attribute as one string, not split into classes like find_all does
+    def match(value):
+        if value is None:
+            return False
+        return name in (value.split() if isinstance(value, str) else value)
+    return match
+
+
+def _parse(text: str, tag: str, class_name: str) -> BeautifulSoup:
+    """Returns a soup of only the tag elements with class_name in a page, so the rest of it never gets built.
+
+    With lxml, the elements are found by lxml and only they are given to BeautifulSoup. Otherwise html.parser
+    skips everything else with a SoupStrainer.
+    """
+    if lxml_html is None:
+        return BeautifulSoup(text, 'html.parser', parse_only=SoupStrainer(tag, class_=_has_class(class_name)))
+
+    try:
+        root = lxml_html.fromstring(text)
+    except etree.ParserError:
+        # empty page
+        return BeautifulSoup('', 'html.parser')
+    elements = root.xpath(f'//{tag}[contains(concat(" ", normalize-space(@class), " "), " {class_name} ")]')
+    fragment = ''.join(lxml_html.tostring(e, encoding='unicode', with_tail=False) for e in elements)
+    return BeautifulSoup(fragment, 'lxml')
 
 
 def _compile_meta_node(meta_node: PageElement):
@@ -15,7 +50,7 @@ def _compile_meta_node(meta_node: PageElement):
         name='div', attrs={'class': 'meta-content'})
 
     for node in data_nodes:
-        members = node.findChildren('span')
+        members = node.find_all('span')
         if len(members) < 2:
             continue
         name = members[-1].text
@@ -28,10 +63,83 @@ def _compile_meta_node(meta_node: PageElement):
             size = members[-3].text
         elif name == 'Version':
             version = data
-        elif name == 'ID':
-            hshop_id = data
         elif name == 'Content Type':
             title_type = data
         elif name == 'Product Code':
             prd_code = data
     return TitleMeta(hshop_id, title_id, size, version, title_type, prd_code)
+
+
+def parse_title_search(text: str, title_id: str):
+    """Returns the title from a search by title ID, or None if the first result isn't that title."""
+    bsoup = _parse(text, 'a', 'list-entry')
+    all_metas = bsoup.find_all(name='a', attrs={
+        'class': 'list-entry block-link'})
+    if all_metas is None or len(all_metas) == 0:
+        return None
+    meta_section = all_metas[0]
+    meta = _compile_meta_node(meta_section)
+    title = meta_section.find_all(
+        name='h3', attrs={'class': 'green bold nospace'})[0].text
+    if meta.title_id != title_id:
+        return None
+    return Title(meta.hshop_id, meta.title_id, meta.size, meta.version, meta.type, meta.product_code, title)
+
+
+def parse_search_results(text: str) -> list[SearchResult]:
+    bsoup = _parse(text, 'a', 'list-entry')
+    results = []
+    for game in bsoup.find_all(name='a', attrs={
+            'class': 'list-entry block-link'}):
+        base_info = game.find(name='div', attrs={'class': 'base-info'})
+        if base_info is None:
+            continue
+        content_spec = base_info.find(name='h4')
+        if content_spec is None:
+            continue
+
+        content_spec = content_spec.find_all(name='span', attrs={
+            'class': 'green bold'})
+        if content_spec is None or len(content_spec) != 2:
+            continue
+        category = content_spec[0].text
+        region = content_spec[1].text
+        game_title = game.find(name='h3', attrs={
+            'class': 'green bold nospace'})
+        if game_title is None:
+            continue
+        game_title = str(game_title.contents[0])
+
+        meta_info = _compile_meta_node(game)
+
+        if meta_info.hshop_id is not None:
+            results.append(SearchResult(meta_info.hshop_id, meta_info.title_id, meta_info.size, meta_info.version,
+                                        meta_info.type, meta_info.product_code, game_title, category, region))
+    return results
+
+
+def parse_related_content(text: str) -> list[RelatedTitle]:
+    bsoup = _parse(text, 'div', 'related')
+    rc = bsoup.find_all(name='div', class_='related')
+    if rc is None or len(rc) == 0:
+        return []
+    related_content = rc[0]
+    results = []
+    for related_item in related_content.find_all(name='a', class_='list-entry'):
+        name = related_item.find_all(
+            name='h3', class_='green bold nospace')[0].text
+
+        meta_blocks = related_item.find_all(name='div', class_='meta')
+
+        relation_type = related_item.find_all(
+            name='span', class_='bold')[0].text.replace('Relation: ', '')
+        meta_info = _compile_meta_node(meta_blocks[1])
+        relation = RelatedTitle(meta_info.hshop_id, meta_info.title_id, meta_info.size,
+                                meta_info.version, meta_info.type, meta_info.product_code, name, relation_type)
+        results.append(relation)
+    return results
+
+
+def parse_download_url(text: str) -> str:
+    bsoup = _parse(text, 'a', 'btn')
+    return bsoup.find_all(name='a', class_='btn')[0].attrs['href']
@@ -19,3 +19,9 @@ class Title(TitleMeta):
 @dataclass
 class RelatedTitle(Title):
     relation_type: str
+
+
+@dataclass
+class SearchResult(Title):
+    category: str
+    region: str
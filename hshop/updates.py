@@ -0,0 +1,85 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from queue import Queue
+from threading import Event
+from typing import TYPE_CHECKING
+
+from hshop.data import find_candidate_linked_content, find_hshop_title
+
+if TYPE_CHECKING:
+    from typing import Iterable, Optional
+
+    from hshop.types import RelatedTitle, Title
+    from sdfs.types import InstalledTitle
+
+# installed titles checked at the same time. each one also fetches its related content in parallel, and the client
+# limits how fast requests go out, so this doesn't need to be high.
+SWEEP_WORKERS = 4
+
+
+@dataclass
+class TitleUpdates:
+    installed: 'InstalledTitle'
+    hshop_title: 'Optional[Title]' = None
+    dlc: 'Optional[RelatedTitle]' = None
+    update: 'Optional[RelatedTitle]' = None
+    # why the title couldn't be checked
+    error: 'Optional[str]' = None
+
+
+def check_title(installed: 'InstalledTitle') -> TitleUpdates:
+    """Looks for the DLC and update of an installed title on hShop, if they aren't installed."""
+    result = TitleUpdates(installed)
+    if installed.dlc_id is not None and installed.update_id is not None:
+        return result
+
+    result.hshop_title = find_hshop_title(installed.id)
+    if result.hshop_title is None:
+        return result
+    for rc in find_candidate_linked_content(result.hshop_title.hshop_id):
+        if rc.relation_type == 'Downloadable Content':
+            result.dlc = rc
+        elif rc.relation_type == 'Update Data':
+            result.update = rc
+    return result
+
+
+class UpdateSweep:
+    """Checks installed titles for updates and DLC, several at a time.
+
+    Every TitleUpdates goes in results as it's done, and None goes in after the last one, so a UI thread can poll it.
+    Titles not started yet when the sweep is cancelled are skipped.
+    """
+
+    def __init__(self, max_workers: int = SWEEP_WORKERS):
+        self.max_workers = max_workers
+        self.results: 'Queue[Optional[TitleUpdates]]' = Queue()
+        self.total = 0
+        self._cancelled = Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _check(self, installed: 'InstalledTitle'):
+        if self.cancelled:
+            return
+        try:
+            result = check_title(installed)
+        except Exception as e:
+            result = TitleUpdates(installed, error=f'{type(e).__name__}: {e}')
+        self.results.put(result)
+
+    def run(self, titles: 'Iterable[InstalledTitle]'):
+        """Checks every title, returning once they are all done or the sweep was cancelled."""
+        try:
+            titles = list(titles)
+            self.total = len(titles)
+            with ThreadPoolExecutor(self.max_workers) as executor:
+                for installed in titles:
+                    executor.submit(self._check, installed)
+        finally:
+            self.results.put(None)
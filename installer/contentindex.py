@@ -0,0 +1,83 @@
+# This file is a part of custom-install.py.
+#
+# custom-install is copyright (c) 2019-2020 Ian Burgwin
+# This file is licensed under The MIT License (MIT).
+# You can find the full license text in LICENSE.md in the root of this project.
+
+import json
+from os import replace, stat
+from os.path import join, relpath
+from threading import Lock
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Dict, Optional
+
+# name of the index, in the root of the SD card
+CONTENT_INDEX_NAME = 'ci-content-index.json'
+
+CONTENT_INDEX_VERSION = 1
+
+
+class ContentIndex:
+    """SHA-256 hashes of the decrypted contents of installed titles, so checking if one changed doesn't mean reading it.
+
+    Entries are keyed by the path relative to the SD root, and only used while the file's size and mtime are the same
+    as when it was hashed.
+    """
+
+    def __init__(self, sd: str):
+        self.sd = sd
+        self.path = join(sd, CONTENT_INDEX_NAME)
+        self._lock = Lock()
+        self.changed = False
+        self.entries: 'Dict[str, dict]' = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == CONTENT_INDEX_VERSION:
+                self.entries = data['contents']
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, AttributeError):
+            # it's only a cache, anything missing gets hashed again
+            self.entries = {}
+
+    def _key(self, path: str):
+        return relpath(path, self.sd).replace('\\', '/')
+
+    def get(self, path: str) -> 'Optional[bytes]':
+        """Returns the recorded hash of the file, if it wasn't changed since."""
+        try:
+            st = stat(path)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            entry = self.entries.get(self._key(path))
+        if entry and entry['size'] == st.st_size and entry['mtime'] == st.st_mtime_ns:
+            return bytes.fromhex(entry['hash'])
+        return None
+
+    def set(self, path: str, content_hash: bytes):
+        st = stat(path)
+        with self._lock:
+            self.entries[self._key(path)] = {'size': st.st_size, 'mtime': st.st_mtime_ns, 'hash': content_hash.hex()}
+            self.changed = True
+
+    def remove_tree(self, root: str):
+        """Forgets every file under root."""
+        prefix = self._key(root) + '/'
+        with self._lock:
+            for key in [k for k in self.entries if k.startswith(prefix)]:
+                del self.entries[key]
+                self.changed = True
+
+    def save(self):
+        with self._lock:
+            if not self.changed:
+                return
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': CONTENT_INDEX_VERSION, 'contents': self.entries}, f)
+            replace(temp_path, self.path)
+            self.changed = False
@@ -8,15 +8,20 @@ import gzip
 import subprocess
 import sys
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from glob import glob
 from hashlib import sha256
-from os import makedirs, rename, scandir
-from os.path import dirname, isdir, isfile, join
+from itertools import chain
+from os import fspath, makedirs, remove, rename, replace, scandir
+from os.path import basename, dirname, getsize, isdir, isfile, join
 from pprint import pformat
 from random import randint
 from shutil import copy2, copyfile, rmtree
 from sys import executable, platform
 from tempfile import TemporaryDirectory
+from threading import BoundedSemaphore, Lock, get_ident
+from time import monotonic
 from traceback import format_exception
 from typing import TYPE_CHECKING, BinaryIO
 
@@ -24,16 +29,26 @@ from utils import InstallStatus
 
 if TYPE_CHECKING:
     from os import PathLike
-    from typing import List, Union, Tuple
+    from typing import Dict, Hashable, List, Optional, Union, Tuple
 
 from events import Events
+from pyctr.common import PyCTRError
 from pyctr.crypto import CryptoEngine, Keyslot, get_seed, load_seeddb
 from pyctr.type.cdn import CDNError, CDNReader
 from pyctr.type.cia import CIAError, CIAReader
-from pyctr.type.ncch import NCCHSection
+from pyctr.type.ncch import NCCHReader, NCCHSection
 from pyctr.type.tmd import TitleMetadataError
 from pyctr.util import roundup
 
+from installer.contentindex import ContentIndex
+from installer.growingfile import IncompleteFileError
+from installer.journal import JOURNAL_NAME, InstallJournal, JournalState
+from installer.pipeline import (PIPELINE_DEPTH, READ_SIZE, copy_pipelined,
+                                write_zeros)
+from installer.metacache import TitleMetadataCache
+from installer.readerpool import (MAX_OPEN_READERS, ContentRecord, ReaderPool,
+                                  TitleDescriptor)
+from sdfs.titledb import TitleDatabase
 from utils import CI_VERSION
 
 if platform == 'msys':
@@ -61,12 +76,15 @@ CMD_MISSING = b'\xff\xff\xff\xff'
 # the size of each file and directory in a title's contents are rounded up to this
 TITLE_ALIGN_SIZE = 0x8000
 
-# size to read at a time when copying files
-READ_SIZE = 0x200000
-
 # version for cifinish.bin
 CIFINISH_VERSION = 3
 
+# how many installed titles to keep in memory before cifinish.bin is written during an install
+CIFINISH_CHECKPOINT = 10
+
+# how long get_free_space_cached reuses a reading, in seconds
+FREE_SPACE_MAX_AGE = 5.0
+
 
 # Placeholder for SDPathErrors
 class SDPathError(Exception):
@@ -98,7 +116,35 @@ def get_free_space(path: 'Union[PathLike, bytes, str]'):
     return free_bytes
 
 
+_free_space_lock = Lock()
+_free_space_cache: 'Dict[str, Tuple[float, int]]' = {}
+
+
+def get_free_space_cached(path: 'Union[PathLike, str]', max_age: float = FREE_SPACE_MAX_AGE):
+    """get_free_space, but a reading less than max_age seconds old is reused."""
+    key = fspath(path)
+    now = monotonic()
+    with _free_space_lock:
+        cached = _free_space_cache.get(key)
+        if cached and now - cached[0] < max_age:
+            return cached[1]
+    free_bytes = get_free_space(path)
+    with _free_space_lock:
+        _free_space_cache[key] = (now, free_bytes)
+    return free_bytes
+
+
+def forget_free_space(path: 'Union[PathLike, str]'):
+    with _free_space_lock:
+        _free_space_cache.pop(fspath(path), None)
+
+
 def load_cifinish(path: 'Union[PathLike, bytes, str]'):
+    return read_cifinish(path)[1]
+
+
+def read_cifinish(path: 'Union[PathLike, bytes, str]'):
+    """Loads cifinish.bin and returns its version and entries. The version is None if the file doesn't exist."""
     try:
         with open(path, 'rb') as f:
             header = f.read(0x10)
@@ -150,10 +196,10 @@ def load_cifinish(path: 'Union[PathLike, bytes, str]'):
                 if title_magic == b'TITLE\0':
                     data[title_id] = {'seed': seed if has_seed else None}
 
-        return data
+        return version, data
     except FileNotFoundError:
         # allow the caller to easily create a new database in the same place where an existing one would be updated
-        return {}
+        return None, {}
 
 
 def save_cifinish(path: 'Union[PathLike, bytes, str]', data: dict):
@@ -181,56 +227,249 @@ def save_cifinish(path: 'Union[PathLike, bytes, str]', data: dict):
             out.write(b''.join(finalize_entry_data))
 
 
+@dataclass
+class StagedTitle:
+    """A title written to its ci-install-temp directory, waiting to be moved into place."""
+    path: 'Union[PathLike, bytes, str]'
+    title_id: str
+    display_title: str
+    temp_title_root: str
+    title_root: str
+    tidhigh_root: str
+    corrupted: bool = False
+    title_info_entry: bytes = b''
+    seed: 'Optional[bytes]' = None
+    # how far this title got, titles resumed from the journal can be past Staged already
+    state: JournalState = JournalState.Staged
+    # contents (relative to the content directory) kept from the installed title instead of being copied
+    reused: 'List[str]' = field(default_factory=list)
+    # hex SHA-256 of every content, for the content index
+    content_hashes: 'Dict[str, str]' = field(default_factory=dict)
+
+
+class CIFinishStore:
+    """Keeps cifinish.bin in memory, and only writes it when there is something new.
+
+    Files of any version load_cifinish can read are accepted, and written back as CIFINISH_VERSION. Writes go to a
+    temporary file first, then replace the original, so an interrupted write never leaves a truncated file behind.
+    """
+
+    def __init__(self, path: 'Union[PathLike, bytes, str]', checkpoint: int = CIFINISH_CHECKPOINT):
+        self.path = fspath(path)
+        self.version, self.data = read_cifinish(self.path)
+        # title IDs that changed since the last flush
+        self.changed = set()
+        # flush after this many changes, 0 to only flush when asked to
+        self.checkpoint = checkpoint
+
+    def set_title(self, title_id: int, seed: 'Optional[bytes]'):
+        entry = {'seed': seed}
+        if self.data.get(title_id) != entry:
+            self.data[title_id] = entry
+            self.changed.add(title_id)
+        if self.checkpoint and len(self.changed) >= self.checkpoint:
+            return self.flush()
+        return False
+
+    @property
+    def needs_flush(self):
+        # older versions are upgraded the next time anything is flushed
+        return bool(self.changed) or (self.version is not None and self.version != CIFINISH_VERSION)
+
+    def flush(self):
+        if not self.needs_flush:
+            return False
+        temp_path = self.path + '.tmp'
+        save_cifinish(temp_path, self.data)
+        replace(temp_path, self.path)
+        self.version = CIFINISH_VERSION
+        self.changed.clear()
+        return True
+
+
+def tmd_hash(title: 'Union[CIAReader, CDNReader]'):
+    return sha256(bytes(title.tmd)).hexdigest()
+
+
+def get_title_name(title: 'Union[CIAReader, CDNReader]'):
+    try:
+        return title.contents[0].exefs.icon.get_app_title().short_desc
+    except:
+        return '(No title)'
+
+
+def describe_title(title: 'Union[CIAReader, CDNReader]', path: 'Union[PathLike, bytes, str]'):
+    try:
+        uses_seed = title.contents[0].flags.uses_seed
+    except (KeyError, AttributeError):
+        uses_seed = False
+    return TitleDescriptor(path=path, title_id=title.tmd.title_id, title_name=get_title_name(title),
+                           install_size=get_install_size(title), tmd_hash=tmd_hash(title), uses_seed=uses_seed,
+                           contents=[ContentRecord(cindex=r.cindex, id=r.id, size=r.size, hash=r.hash.hex())
+                                     for r in title.content_info])
+
+
+def describe_path(path: 'Union[PathLike, bytes, str]', reader_pool: ReaderPool,
+                  metadata_cache: 'Optional[TitleMetadataCache]' = None):
+    """Returns the TitleDescriptor of a title, from metadata_cache if it's there, or by reading it from reader_pool."""
+    if metadata_cache:
+        title = metadata_cache.get(path)
+        if title:
+            return title
+    with reader_pool.open(path) as reader:
+        title = describe_title(reader, path)
+    if metadata_cache:
+        metadata_cache.put(path, title)
+    return title
+
+
+def open_cia_stream(fp: 'BinaryIO'):
+    """Opens a CIA that is read from start to end, like one still downloading into a GrowingFile.
+
+    Only the first content is loaded up front, since the others come after all of its data. The rest are only read
+    through open_raw_section when they are installed, in order. fp is closed with the reader.
+    """
+    reader = CIAReader(fp, closefd=True, load_contents=False)
+    try:
+        if reader.content_info and reader.content_info[0].cindex == 0 and reader.tmd.title_id[3:5] != '48':
+            reader.contents[0] = NCCHReader(reader.open_raw_section(0))
+    except BaseException:
+        reader.close()
+        raise
+    return reader
+
+
 def get_install_size(title: 'Union[CIAReader, CDNReader]'):
-    sizes = [1] * 5
+    # this calculates the size to put in the Title Info Entry.
+    # every file and directory is rounded up to TITLE_ALIGN_SIZE, the 5 are the ones every title has.
+    title_size = 5 * TITLE_ALIGN_SIZE
 
     if title.tmd.save_size:
         # one for the data directory, one for the 00000001.sav file
-        sizes.extend((1, title.tmd.save_size))
+        title_size += TITLE_ALIGN_SIZE + roundup(title.tmd.save_size, TITLE_ALIGN_SIZE)
 
-    for record in title.content_info:
-        sizes.append(record.size)
-
-    # this calculates the size to put in the Title Info Entry
-    title_size = sum(roundup(x, TITLE_ALIGN_SIZE) for x in sizes)
+    # same as rounding up each content, without a call per content
+    align_mask = TITLE_ALIGN_SIZE - 1
+    title_size += sum((record.size + align_mask) & ~align_mask for record in title.content_info)
 
     return title_size
 
 
+class InstallSizeIndex:
+    """Install sizes of queued titles, updated as titles are added and removed so the total is always ready."""
+
+    def __init__(self):
+        self.sizes: 'Dict[Hashable, int]' = {}
+        self.total = 0
+
+    def add(self, key: 'Hashable', size: int):
+        self.remove(key)
+        self.sizes[key] = size
+        self.total += size
+        return size
+
+    def remove(self, key: 'Hashable'):
+        self.total -= self.sizes.pop(key, 0)
+
+    def largest(self, count: int):
+        """Returns the count biggest titles and their sizes."""
+        return sorted(self.sizes.items(), key=lambda item: item[1], reverse=True)[:count]
+
+    def __len__(self):
+        return len(self.sizes)
+
+
 class CustomInstall:
     def __init__(self, *, movable, sd, cifinish_out=None, overwrite_saves=False, skip_contents=False,
-                 boot9=None, seeddb=None):
+                 boot9=None, seeddb=None, batch_import=True, read_size=READ_SIZE,
+                 pipeline_depth=PIPELINE_DEPTH, install_workers=1, sd_writers=1, resume=True,
+                 skip_unchanged=False, reader_pool: 'Optional[ReaderPool]' = None,
+                 metadata_cache: 'Optional[TitleMetadataCache]' = None):
         self.event = Events()
         self.log_lines = []  # Stores all info messages for user to view
 
         self.crypto = CryptoEngine(boot9=boot9)
         self.crypto.setup_sd_key_from_file(movable)
         self.seeddb = seeddb
-        self.readers: 'List[Tuple[Union[CDNReader, CIAReader], Union[PathLike, bytes, str]]]' = [
+        # queued titles. readers put here are added to reader_pool when the install starts, so they can be closed
+        # while other titles are being installed.
+        self.readers: 'List[Tuple[Union[CDNReader, CIAReader, TitleDescriptor], Union[PathLike, bytes, str]]]' = [
         ]
+        # readers are only opened while their title is being installed, or the most recently used ones
+        self.reader_pool = reader_pool or ReaderPool(self.get_reader, MAX_OPEN_READERS)
+        # titles read before don't have to be read again to be queued
+        self.metadata_cache = metadata_cache
         self.sd = sd
         self.skip_contents = skip_contents
         self.overwrite_saves = overwrite_saves
         self.cifinish_out = cifinish_out
         self.movable = movable
-
-    def copy_with_progress(self, src: BinaryIO, dst: BinaryIO, size: int, path: str, fire_event: bool = True):
-        left = size
+        # import every title into title.db with one save3ds_fuse run at the end, instead of one run per title
+        self.batch_import = batch_import
+        # block size and how many blocks can be buffered between the stages of copy_with_progress
+        self.read_size = read_size
+        self.pipeline_depth = pipeline_depth
+        # how many titles are staged at once, and how many files can be written to the SD card at once.
+        # flash media gets a lot slower with many writers, so the second one should usually stay at 1.
+        self.install_workers = install_workers
+        self.sd_write_slots = BoundedSemaphore(sd_writers)
+
+        # keep a journal on the SD card so an interrupted install can be continued by the next one
+        self.resume = resume
+        self.journal: 'Optional[InstallJournal]' = None
+
+        # only copy the contents that differ from the ones of the installed title
+        self.skip_unchanged = skip_unchanged
+        self.content_index: 'Optional[ContentIndex]' = None
+
+        # copy progress of each title being staged, by thread
+        self._progress_lock = Lock()
+        self._progress: 'Dict[int, Tuple[int, int]]' = {}
+        self._finished_titles = 0
+
+    def copy_with_progress(self, src: BinaryIO, dst: BinaryIO, size: int, path: str, fire_event: bool = True,
+                           head_size: int = 0):
         cipher = self.crypto.create_ctr_cipher(
             Keyslot.SD, self.crypto.sd_path_to_iv(path))
-        hasher = sha256()
-        while left > 0:
-            to_read = min(READ_SIZE, left)
-            data = src.read(READ_SIZE)
-            hasher.update(data)
-            dst.write(cipher.encrypt(data))
-            left -= to_read
-            total_read = size - left
-            if fire_event:
-                self.event.update_percentage(
-                    (total_read / size) * 100, total_read / 1048576, size / 1048576)
-
-        return hasher.digest()
+
+        def progress(total_read):
+            self._report_progress(total_read, size)
+
+        return copy_pipelined(src, dst, size, cipher, block_size=self.read_size, depth=self.pipeline_depth,
+                              progress=progress if fire_event else None, write_slot=self.sd_write_slots,
+                              head_size=head_size)
+
+    # update_percentage gets the sum of the progress of every title being staged,
+    # and on_cia_start gets the number of titles that have finished staging.
+    # with one worker, these are the progress of the current content and the index of the current title.
+    # the events are fired after the lock is released, so a slow handler doesn't hold up the other workers.
+    def _report_progress(self, total_read: int, size: int):
+        with self._progress_lock:
+            self._progress[get_ident()] = (total_read, size)
+            progress = self._progress_snapshot()
+        self.event.update_percentage(*progress)
+
+    def _begin_title_progress(self):
+        with self._progress_lock:
+            self._progress[get_ident()] = (0, 0)
+            finished = self._finished_titles
+        self.event.on_cia_start(finished)
+
+    def _end_title_progress(self):
+        with self._progress_lock:
+            del self._progress[get_ident()]
+            self._finished_titles += 1
+            finished = self._finished_titles
+            progress = self._progress_snapshot()
+        self.event.on_cia_start(finished)
+        self.event.update_percentage(*progress)
+
+    def _progress_snapshot(self) -> 'Tuple[float, float, float]':
+        # only called with the lock held
+        total_percent = sum(r / s * 100 for r, s in self._progress.values() if s)
+        total_read = sum(r for r, _ in self._progress.values())
+        size = sum(s for _, s in self._progress.values())
+        return total_percent, total_read / 1048576, size / 1048576
 
     @staticmethod
     def get_reader(path: 'Union[PathLike, bytes, str]'):
@@ -255,24 +494,64 @@ class CustomInstall:
         for path in paths:
             self.log(f'Reading {path}')
             try:
-                reader = self.get_reader(path)
+                title = self.describe(path)
             except (CIAError, CDNError, TitleMetadataError):
                 self.log(f"Couldn't read {
                          path}, likely corrupt or not a CIA or CDN title")
                 continue
-            if reader.tmd.title_id.startswith('00048'):  # DSiWare
+            if title.title_id.startswith('00048'):  # DSiWare
                 self.log(
-                    f'Skipping {reader.tmd.title_id} - DSiWare is not supported')
+                    f'Skipping {title.title_id} - DSiWare is not supported')
+                self.reader_pool.discard(path)
                 continue
-            readers.append((reader, path))
+            readers.append((title, path))
         self.readers = readers
+        if self.metadata_cache:
+            self.metadata_cache.save()
+
+    def describe(self, path: 'Union[PathLike, bytes, str]'):
+        """Reads what is needed about a title to queue it. The reader is left in reader_pool for the install."""
+        return describe_path(path, self.reader_pool, self.metadata_cache)
+
+    def describe_readers(self) -> 'List[Tuple[TitleDescriptor, Union[PathLike, bytes, str]]]':
+        """Moves readers in self.readers into reader_pool, leaving their descriptors."""
+        titles = []
+        for title, path in self.readers:
+            if not isinstance(title, TitleDescriptor):
+                self.reader_pool.add(path, title)
+                title = describe_title(title, path)
+            titles.append((title, path))
+        self.readers = titles
+        return titles
+
+    def drop_duplicate_titles(self, install_state: 'Dict[str, List[str]]'):
+        """Keeps only the first of each title ID in self.readers.
+
+        Copies of a title would be staged into the same title directory and journal entry, possibly at the same time
+        with install_workers, so the others are not installed.
+        """
+        titles = []
+        seen = set()
+        for title, path in self.describe_readers():
+            if title.title_id in seen:
+                self.log(f'Skipping {path} - {title.title_id} is already queued')
+                install_state['failed'].append(str(path))
+                self.update_status(path, InstallStatus.Failed)
+                continue
+            seen.add(title.title_id)
+            titles.append((title, path))
+        self.readers = titles
+        return titles
 
-    def check_size(self):
-        total_size = 0
-        for r, _ in self.readers:
-            total_size += get_install_size(r)
+    def check_size(self, total_size: 'Optional[int]' = None):
+        """Returns the install size of the queued titles and the free space on the SD card.
 
-        free_space = get_free_space(self.sd)
+        If the caller already keeps the total (like with InstallSizeIndex), it can be given so it isn't counted again.
+        """
+        if total_size is None:
+            total_size = sum(t.install_size for t, _ in self.describe_readers())
+
+        free_space = get_free_space_cached(self.sd)
         return total_size, free_space
 
     def check_for_id0(self):
@@ -310,7 +589,7 @@ class CustomInstall:
             cifinish_path = join(self.sd, 'cifinish.bin')
 
         try:
-            cifinish_data = load_cifinish(cifinish_path)
+            cifinish = CIFinishStore(cifinish_path)
         except InvalidCIFinishError as e:
             self.log(f'{type(e).__qualname__}: {e}')
             self.log(f'{cifinish_path} was corrupt!\n'
@@ -373,287 +652,97 @@ class CustomInstall:
 
             # extract the title database to add our own entry to
             self.log('Extracting Title Database...')
-            out = subprocess.run(save3ds_fuse_common_args + ['-x'],
-                                 stdout=subprocess.PIPE,
-                                 stderr=subprocess.STDOUT,
-                                 encoding='utf-8',
-                                 **extra_kwargs)
-            if out.returncode:
-                for l in out.stdout.split('\n'):
-                    self.log(l)
-                self.log('Command line:')
-                for l in pformat(out.args).split('\n'):
-                    self.log(l)
+            if not self.run_save3ds_fuse(save3ds_fuse_common_args + ['-x'], extra_kwargs):
                 return None, False, 0
 
             install_state = {'installed': [], 'failed': []}
 
-            # Now loop through all provided cia files
-            for idx, info in enumerate(self.readers):
-                cia, path = info
+            # titles whose Title Info Entry is written but not imported yet, when batch importing
+            pending_imports = []
 
-                self.event.on_cia_start(idx)
-                self.event.update_status(path, InstallStatus.Starting)
+            self._progress = {}
+            self._finished_titles = 0
+            committed = 0
 
-                temp_title_root = join(
-                    self.sd, f'ci-install-temp-{cia.tmd.title_id}-{randint(0, 0xFFFFFFFF):08x}')
-                makedirs(temp_title_root, exist_ok=True)
+            if self.skip_unchanged:
+                self.content_index = ContentIndex(self.sd)
 
-                tid_parts = (cia.tmd.title_id[0:8], cia.tmd.title_id[8:16])
+            readers = self.drop_duplicate_titles(install_state)
+            resumed = []
+            if self.resume:
+                self.journal = InstallJournal(join(self.sd, JOURNAL_NAME))
+                resumed, readers = self.resume_from_journal(sd_path)
 
-                try:
-                    display_title = f'{
-                        cia.contents[0].exefs.icon.get_app_title().short_desc} - {cia.tmd.title_id}'
-                except:
-                    display_title = cia.tmd.title_id
-                self.log(f'Installing {display_title}...')
+            # Now loop through all provided cia files
+            executor = None
+            if self.install_workers > 1:
+                self.log(f'Staging titles with {self.install_workers} workers...')
+                executor = ThreadPoolExecutor(self.install_workers)
+                futures = [executor.submit(self.stage_title, path, sd_path)
+                           for _, path in readers]
+                staged_titles = (f.result() for f in futures)
+            else:
+                staged_titles = (self.stage_title(path, sd_path)
+                                 for _, path in readers)
 
-                title_size = get_install_size(cia)
+            try:
+                # the rest touches the SD title directory, cifinish.bin and title.db,
+                # so it's done for one title at a time in the original order
+                for staged in chain(resumed, staged_titles):
+                    if staged.corrupted:
+                        install_state['failed'].append(staged.display_title)
+                        continue
 
-                # checks if this is dlc, which has some differences
-                is_dlc = tid_parts[0] == '0004008c'
+                    if staged.state is JournalState.Imported:
+                        # this was finished by an earlier install that stopped before it could clean up
+                        install_state['installed'].append(staged.display_title)
+                        self.update_status(staged.path, InstallStatus.Done)
+                        continue
 
-                # this checks if it has a manual (index 1) and is not DLC
-                has_manual = (not is_dlc) and (1 in cia.contents)
+                    self.commit_title(staged, cifinish, tempdir)
+                    committed += 1
 
-                # this gets the extdata id from the extheader, stored in the storage info area
-                try:
-                    with cia.contents[0].open_raw_section(NCCHSection.ExtendedHeader) as e:
-                        e.seek(0x200 + 0x30)
-                        extdata_id = e.read(8)
-                except KeyError:
-                    # not an executable title
-                    extdata_id = b'\0' * 8
-
-                # cmd content id, starts with 1 for non-dlc contents
-                cmd_id = len(cia.content_info) if is_dlc else 1
-                cmd_filename = f'{cmd_id:08x}.cmd'
-
-                # this is where the final directory will be moved
-                tidhigh_root = join(sd_path, 'title', tid_parts[0])
-
-                # get the title root where all the contents will be
-                title_root = join(sd_path, 'title', *tid_parts)
-                content_root = join(title_root, 'content')
-                # generate the path used for the IV
-                title_root_cmd = f'/title/{"/".join(tid_parts)}'
-                content_root_cmd = title_root_cmd + '/content'
-
-                temp_content_root = join(temp_title_root, 'content')
-
-                if not self.skip_contents:
-                    self.event.update_status(path, InstallStatus.Writing)
-                    makedirs(join(temp_content_root, 'cmd'), exist_ok=True)
-                    if cia.tmd.save_size:
-                        makedirs(join(temp_title_root, 'data'), exist_ok=True)
-                    if is_dlc:
-                        # create the separate directories for every 256 contents
-                        for x in range(((len(cia.content_info) - 1) // 256) + 1):
-                            makedirs(join(temp_content_root, f'{
-                                     x:08x}'), exist_ok=True)
-
-                    # maybe this will be changed in the future
-                    tmd_id = 0
-
-                    tmd_filename = f'{tmd_id:08x}.tmd'
-
-                    # write the tmd
-                    tmd_enc_path = content_root_cmd + '/' + tmd_filename
-                    self.log(f'Writing {tmd_enc_path}...')
-                    with open(join(temp_content_root, tmd_filename), 'wb') as o:
-                        with self.crypto.create_ctr_io(Keyslot.SD, o, self.crypto.sd_path_to_iv(tmd_enc_path)) as e:
-                            e.write(bytes(cia.tmd))
-
-                    # in case the contents are corrupted
-                    do_continue = False
-                    # write each content
-                    for co in cia.content_info:
-                        content_filename = co.id + '.app'
-                        if is_dlc:
-                            dir_index = format((co.cindex // 256), '08x')
-                            content_enc_path = content_root_cmd + \
-                                f'/{dir_index}/{content_filename}'
-                            content_out_path = join(
-                                temp_content_root, dir_index, content_filename)
-                        else:
-                            content_enc_path = content_root_cmd + '/' + content_filename
-                            content_out_path = join(
-                                temp_content_root, content_filename)
-                        self.log(f'Writing {content_enc_path}...')
-                        with cia.open_raw_section(co.cindex) as s, open(content_out_path, 'wb') as o:
-                            result_hash = self.copy_with_progress(
-                                s, o, co.size, content_enc_path)
-                            if result_hash != co.hash:
-                                self.log(f'WARNING: Hash does not match for {
-                                         content_enc_path}!')
-                                install_state['failed'].append(display_title)
-                                rename(temp_title_root,
-                                       temp_title_root + '-corrupted')
-                                do_continue = True
-                                self.event.update_status(
-                                    path, InstallStatus.Failed)
-                                break
-
-                    if do_continue:
+                    if self.batch_import:
+                        # the import happens once, after every title has been written
+                        pending_imports.append(
+                            (staged.title_id, staged.path, staged.display_title))
                         continue
 
-                    # generate a blank save
-                    if cia.tmd.save_size:
-                        sav_enc_path = title_root_cmd + '/data/00000001.sav'
-                        tmp_sav_out_path = join(
-                            temp_title_root, 'data', '00000001.sav')
-                        sav_out_path = join(title_root, 'data', '00000001.sav')
-                        if self.overwrite_saves or not isfile(sav_out_path):
-                            cipher = crypto.create_ctr_cipher(
-                                Keyslot.SD, crypto.sd_path_to_iv(sav_enc_path))
-                            # in a new save, the first 0x20 are all 00s. the rest can be random
-                            data = cipher.encrypt(b'\0' * 0x20)
-                            self.log(f'Generating blank save at {
-                                     sav_enc_path}...')
-                            with open(tmp_sav_out_path, 'wb') as o:
-                                o.write(data)
-                                o.write(b'\0' * (cia.tmd.save_size - 0x20))
-                        else:
-                            self.log(f'Copying original save file from {
-                                     sav_enc_path}...')
-                            copy2(sav_out_path, tmp_sav_out_path)
-
-                    # generate and write cmd
-                    cmd_enc_path = content_root_cmd + '/cmd/' + cmd_filename
-                    cmd_out_path = join(temp_content_root, 'cmd', cmd_filename)
-                    self.log(f'Generating {cmd_enc_path}')
-                    highest_index = 0
-                    content_ids = {}
-
-                    for record in cia.content_info:
-                        highest_index = record.cindex
-                        with cia.open_raw_section(record.cindex) as s:
-                            s.seek(0x100)
-                            cmac_data = s.read(0x100)
-
-                        id_bytes = bytes.fromhex(record.id)[::-1]
-                        cmac_data += record.cindex.to_bytes(
-                            4, 'little') + id_bytes
-
-                        cmac_ncch = crypto.create_cmac_object(
-                            Keyslot.CMACSDNAND)
-                        cmac_ncch.update(sha256(cmac_data).digest())
-                        content_ids[record.cindex] = (
-                            id_bytes, cmac_ncch.digest())
-
-                    # add content IDs up to the last one
-                    ids_by_index = [CMD_MISSING] * (highest_index + 1)
-                    installed_ids = []
-                    cmacs = []
-                    for x in range(len(ids_by_index)):
-                        try:
-                            info = content_ids[x]
-                        except KeyError:
-                            # "MISSING CONTENT!"
-                            # The 3DS does generate a cmac for missing contents, but I don't know how it works.
-                            # It doesn't matter anyway, the title seems to be fully functional.
-                            cmacs.append(bytes.fromhex(
-                                '4D495353494E4720434F4E54454E5421'))
-                        else:
-                            ids_by_index[x] = info[0]
-                            cmacs.append(info[1])
-                            installed_ids.append(info[0])
-                    installed_ids.sort(
-                        key=lambda x: int.from_bytes(x, 'little'))
-
-                    final = (cmd_id.to_bytes(4, 'little')
-                             + len(ids_by_index).to_bytes(4, 'little')
-                             + len(installed_ids).to_bytes(4, 'little')
-                             + (1).to_bytes(4, 'little'))
-                    cmac_cmd_header = crypto.create_cmac_object(
-                        Keyslot.CMACSDNAND)
-                    cmac_cmd_header.update(final)
-                    final += cmac_cmd_header.digest()
-
-                    final += b''.join(ids_by_index)
-                    final += b''.join(installed_ids)
-                    final += b''.join(cmacs)
-
-                    cipher = crypto.create_ctr_cipher(
-                        Keyslot.SD, crypto.sd_path_to_iv(cmd_enc_path))
-                    self.log(f'Writing {cmd_enc_path}')
-                    with open(cmd_out_path, 'wb') as o:
-                        o.write(cipher.encrypt(final))
-
-                # this starts building the title info entry
-                title_info_entry_data = [
-                    # title size
-                    title_size.to_bytes(8, 'little'),
-                    # title type, seems to usually be 0x40
-                    0x40.to_bytes(4, 'little'),
-                    # title version
-                    int(cia.tmd.title_version).to_bytes(2, 'little'),
-                    # ncch version
-                    cia.contents[0].version.to_bytes(2, 'little'),
-                    # flags_0, only checking if there is a manual
-                    (1 if has_manual else 0).to_bytes(4, 'little'),
-                    # tmd content id, always starting with 0
-                    (0).to_bytes(4, 'little'),
-                    # cmd content id
-                    cmd_id.to_bytes(4, 'little'),
-                    # flags_1, only checking save data
-                    (1 if cia.tmd.save_size else 0).to_bytes(4, 'little'),
-                    # extdataid low
-                    extdata_id[0:4],
-                    # reserved
-                    b'\0' * 4,
-                    # flags_2, only using a common value
-                    0x100000000.to_bytes(8, 'little'),
-                    # product code
-                    cia.contents[0].product_code.encode(
-                        'ascii').ljust(0x10, b'\0'),
-                    # reserved
-                    b'\0' * 0x10,
-                    # unknown
-                    randint(0, 0xFFFFFFFF).to_bytes(4, 'little'),
-                    # reserved
-                    b'\0' * 0x2c
-                ]
-
-                self.event.update_status(path, InstallStatus.Finishing)
-                if isdir(title_root):
-                    self.log(f'Removing original install at {title_root}...')
-                    rmtree(title_root)
-
-                makedirs(tidhigh_root, exist_ok=True)
-                rename(temp_title_root, title_root)
-
-                cifinish_data[int(cia.tmd.title_id, 16)] = {'seed': (get_seed(
-                    cia.contents[0].program_id) if cia.contents[0].flags.uses_seed else None)}
-
-                # This is saved regardless if any titles were installed, so the file can be upgraded just in case.
-                save_cifinish(cifinish_path, cifinish_data)
-
-                with open(join(tempdir, cia.tmd.title_id), 'wb') as o:
-                    o.write(b''.join(title_info_entry_data))
-
-                # import the directory, now including our title
-                self.log('Importing into Title Database...')
-                out = subprocess.run(save3ds_fuse_common_args + ['-i'],
-                                     stdout=subprocess.PIPE,
-                                     stderr=subprocess.STDOUT,
-                                     encoding='utf-8',
-                                     **extra_kwargs)
-                if out.returncode:
-                    for l in out.stdout.split('\n'):
-                        self.log(l)
-                    self.log('Command line:')
-                    for l in pformat(out.args).split('\n'):
-                        self.log(l)
-                    install_state['failed'].append(display_title)
-                    self.event.update_status(path, InstallStatus.Failed)
-                else:
-                    install_state['installed'].append(display_title)
-                    self.event.update_status(path, InstallStatus.Done)
+                    # import the directory, now including our title
+                    self.log('Importing into Title Database...')
+                    if self.run_save3ds_fuse(save3ds_fuse_common_args + ['-i'], extra_kwargs):
+                        self._journal_update(staged.title_id, JournalState.Imported)
+                        install_state['installed'].append(staged.display_title)
+                        self.update_status(staged.path, InstallStatus.Done)
+                    else:
+                        install_state['failed'].append(staged.display_title)
+                        self.update_status(staged.path, InstallStatus.Failed)
+            finally:
+                if executor:
+                    executor.shutdown(cancel_futures=True)
+                # titles that were moved into place need their entries, even if something failed later
+                if committed and cifinish.flush():
+                    self._journal_promote(JournalState.Renamed, JournalState.CIFinish)
+                if self.content_index:
+                    self.content_index.save()
+
+            if pending_imports:
+                self.import_batch(pending_imports, tempdir,
+                                  save3ds_fuse_common_args, extra_kwargs, install_state)
+
+            if self.journal:
+                # titles that didn't make it into title.db stay, so the next install can try again
+                self.journal.remove(*[title_id for title_id, entry in self.journal.entries.items()
+                                      if entry['state'] == JournalState.Imported.value])
 
             copied = False
-            # launchable applications, not DLC or update data
-            application_count = len(glob(join(tempdir, '00040000*')))
+            # launchable applications, not DLC or update data.
+            # title.db is read after importing, so only titles that made it in are counted.
+            try:
+                with TitleDatabase.from_file(titledb_path, crypto) as db:
+                    application_count = db.count_applications()
+            except (PyCTRError, OSError):
+                application_count = len(glob(join(tempdir, '00040000*')))
             if install_state['installed']:
                 if application_count >= 300:
                     self.log(
@@ -680,8 +769,475 @@ class CustomInstall:
                     self.log(
                         'custom-install-finalize has been copied to the SD card.')
 
+            # whatever was read before is out of date now
+            forget_free_space(self.sd)
             return install_state, copied, application_count
 
+    def stage_title(self, path: 'Union[PathLike, bytes, str]', sd_path: str):
+        """Writes a title to its ci-install-temp directory and builds its Title Info Entry.
+
+        Nothing outside of the title's own temp directory is changed, so several titles can be staged at once.
+        """
+        self._begin_title_progress()
+        try:
+            with self.reader_pool.open(path) as cia:
+                if cia.tmd.title_id.startswith('00048'):
+                    # only titles installed while they download get this far, the others are skipped when queued
+                    self.log(f'Skipping {cia.tmd.title_id} - DSiWare is not supported')
+                    return self._failed_title(path)
+                return self._stage_title(cia, path, sd_path)
+        except IncompleteFileError as e:
+            # a title being installed while it downloads, whose download failed. the others can still be installed,
+            # and anything already written is removed by the next install like any other unfinished title.
+            self.log(f'Download of {path} stopped before it was installed: {e}', 1)
+            return self._failed_title(path)
+        finally:
+            self._end_title_progress()
+
+    def _failed_title(self, path: 'Union[PathLike, bytes, str]'):
+        self.update_status(path, InstallStatus.Failed)
+        return StagedTitle(path=path, title_id='', display_title=str(path), temp_title_root='', title_root='',
+                           tidhigh_root='', corrupted=True)
+
+    def _stage_title(self, cia: 'Union[CDNReader, CIAReader]', path: 'Union[PathLike, bytes, str]', sd_path: str):
+        crypto = self.crypto
+        self.update_status(path, InstallStatus.Starting)
+
+        temp_title_root = join(
+            self.sd, f'ci-install-temp-{cia.tmd.title_id}-{randint(0, 0xFFFFFFFF):08x}')
+        makedirs(temp_title_root, exist_ok=True)
+
+        tid_parts = (cia.tmd.title_id[0:8], cia.tmd.title_id[8:16])
+
+        try:
+            display_title = f'{
+                cia.contents[0].exefs.icon.get_app_title().short_desc} - {cia.tmd.title_id}'
+        except:
+            display_title = cia.tmd.title_id
+        self.log(f'Installing {display_title}...')
+
+        title_size = get_install_size(cia)
+
+        # checks if this is dlc, which has some differences
+        is_dlc = tid_parts[0] == '0004008c'
+
+        # this checks if it has a manual (index 1) and is not DLC.
+        # content_info is used since a streamed CIA only has the first content loaded.
+        has_manual = (not is_dlc) and any(co.cindex == 1 for co in cia.content_info)
+
+        # this gets the extdata id from the extheader, stored in the storage info area
+        try:
+            with cia.contents[0].open_raw_section(NCCHSection.ExtendedHeader) as e:
+                e.seek(0x200 + 0x30)
+                extdata_id = e.read(8)
+        except KeyError:
+            # not an executable title
+            extdata_id = b'\0' * 8
+
+        # cmd content id, starts with 1 for non-dlc contents
+        cmd_id = len(cia.content_info) if is_dlc else 1
+        cmd_filename = f'{cmd_id:08x}.cmd'
+
+        # this is where the final directory will be moved
+        tidhigh_root = join(sd_path, 'title', tid_parts[0])
+
+        # get the title root where all the contents will be
+        title_root = join(sd_path, 'title', *tid_parts)
+        content_root = join(title_root, 'content')
+        # generate the path used for the IV
+        title_root_cmd = f'/title/{"/".join(tid_parts)}'
+        content_root_cmd = title_root_cmd + '/content'
+
+        temp_content_root = join(temp_title_root, 'content')
+
+        staged = StagedTitle(path=path, title_id=cia.tmd.title_id, display_title=display_title,
+                             temp_title_root=temp_title_root, title_root=title_root, tidhigh_root=tidhigh_root)
+        self._journal_update(staged.title_id, JournalState.Staging,
+                             temp_dir=basename(temp_title_root))
+
+        if not self.skip_contents:
+            self.update_status(path, InstallStatus.Writing)
+            makedirs(join(temp_content_root, 'cmd'), exist_ok=True)
+            if cia.tmd.save_size:
+                makedirs(join(temp_title_root, 'data'), exist_ok=True)
+            if is_dlc:
+                # create the separate directories for every 256 contents
+                for x in range(((len(cia.content_info) - 1) // 256) + 1):
+                    makedirs(join(temp_content_root, f'{
+                             x:08x}'), exist_ok=True)
+
+            # maybe this will be changed in the future
+            tmd_id = 0
+
+            tmd_filename = f'{tmd_id:08x}.tmd'
+
+            # write the tmd
+            tmd_enc_path = content_root_cmd + '/' + tmd_filename
+            self.log(f'Writing {tmd_enc_path}...')
+            with open(join(temp_content_root, tmd_filename), 'wb') as o:
+                with self.crypto.create_ctr_io(Keyslot.SD, o, self.crypto.sd_path_to_iv(tmd_enc_path)) as e:
+                    e.write(bytes(cia.tmd))
+
+            # content id and cmac for each content index, for the cmd file
+            content_ids = {}
+            highest_index = 0
+
+            # write each content
+            for co in cia.content_info:
+                content_filename = co.id + '.app'
+                if is_dlc:
+                    dir_index = format((co.cindex // 256), '08x')
+                    content_enc_path = content_root_cmd + \
+                        f'/{dir_index}/{content_filename}'
+                    content_rel_path = join(dir_index, content_filename)
+                else:
+                    content_enc_path = content_root_cmd + '/' + content_filename
+                    content_rel_path = content_filename
+                content_out_path = join(temp_content_root, content_rel_path)
+                staged.content_hashes[content_rel_path] = co.hash.hex()
+
+                ncch_header = None
+                if self.skip_unchanged:
+                    ncch_header = self.get_unchanged_header(
+                        join(content_root, content_rel_path), content_enc_path, co)
+                if ncch_header is not None:
+                    # same path means same iv, so the installed file is moved into the new install as it is
+                    self.log(f'Keeping unchanged {content_enc_path}')
+                    staged.reused.append(content_rel_path)
+                    result_hash = co.hash
+                else:
+                    self.log(f'Writing {content_enc_path}...')
+                    with cia.open_raw_section(co.cindex) as s, open(content_out_path, 'wb') as o:
+                        # the start of the NCCH header is kept for the cmac, so the content isn't read again
+                        result_hash, ncch_header = self.copy_with_progress(
+                            s, o, co.size, content_enc_path, head_size=0x200)
+                if result_hash != co.hash:
+                    self.log(f'WARNING: Hash does not match for {
+                             content_enc_path}!')
+                    rename(temp_title_root,
+                           temp_title_root + '-corrupted')
+                    self.update_status(
+                        path, InstallStatus.Failed)
+                    staged.corrupted = True
+                    self._journal_remove(staged.title_id)
+                    return staged
+
+                highest_index = co.cindex
+                id_bytes = bytes.fromhex(co.id)[::-1]
+                cmac_data = ncch_header[0x100:0x200] + co.cindex.to_bytes(
+                    4, 'little') + id_bytes
+
+                cmac_ncch = crypto.create_cmac_object(
+                    Keyslot.CMACSDNAND)
+                cmac_ncch.update(sha256(cmac_data).digest())
+                content_ids[co.cindex] = (
+                    id_bytes, cmac_ncch.digest())
+
+            # generate a blank save
+            if cia.tmd.save_size:
+                sav_enc_path = title_root_cmd + '/data/00000001.sav'
+                tmp_sav_out_path = join(
+                    temp_title_root, 'data', '00000001.sav')
+                sav_out_path = join(title_root, 'data', '00000001.sav')
+                if self.overwrite_saves or not isfile(sav_out_path):
+                    cipher = crypto.create_ctr_cipher(
+                        Keyslot.SD, crypto.sd_path_to_iv(sav_enc_path))
+                    # in a new save, the first 0x20 are all 00s. the rest can be random
+                    data = cipher.encrypt(b'\0' * 0x20)
+                    self.log(f'Generating blank save at {
+                             sav_enc_path}...')
+                    with self.sd_write_slots, open(tmp_sav_out_path, 'wb') as o:
+                        o.write(data)
+                        write_zeros(o, cia.tmd.save_size - 0x20)
+                else:
+                    self.log(f'Copying original save file from {
+                             sav_enc_path}...')
+                    copy2(sav_out_path, tmp_sav_out_path)
+
+            # generate and write cmd
+            cmd_enc_path = content_root_cmd + '/cmd/' + cmd_filename
+            cmd_out_path = join(temp_content_root, 'cmd', cmd_filename)
+            self.log(f'Generating {cmd_enc_path}')
+
+            # add content IDs up to the last one
+            ids_by_index = [CMD_MISSING] * (highest_index + 1)
+            installed_ids = []
+            cmacs = []
+            for x in range(len(ids_by_index)):
+                try:
+                    info = content_ids[x]
+                except KeyError:
+                    # "MISSING CONTENT!"
+                    # The 3DS does generate a cmac for missing contents, but I don't know how it works.
+                    # It doesn't matter anyway, the title seems to be fully functional.
+                    cmacs.append(bytes.fromhex(
+                        '4D495353494E4720434F4E54454E5421'))
+                else:
+                    ids_by_index[x] = info[0]
+                    cmacs.append(info[1])
+                    installed_ids.append(info[0])
+            installed_ids.sort(
+                key=lambda x: int.from_bytes(x, 'little'))
+
+            final = (cmd_id.to_bytes(4, 'little')
+                     + len(ids_by_index).to_bytes(4, 'little')
+                     + len(installed_ids).to_bytes(4, 'little')
+                     + (1).to_bytes(4, 'little'))
+            cmac_cmd_header = crypto.create_cmac_object(
+                Keyslot.CMACSDNAND)
+            cmac_cmd_header.update(final)
+            final += cmac_cmd_header.digest()
+
+            final += b''.join(ids_by_index)
+            final += b''.join(installed_ids)
+            final += b''.join(cmacs)
+
+            cipher = crypto.create_ctr_cipher(
+                Keyslot.SD, crypto.sd_path_to_iv(cmd_enc_path))
+            self.log(f'Writing {cmd_enc_path}')
+            with open(cmd_out_path, 'wb') as o:
+                o.write(cipher.encrypt(final))
+
+        # this starts building the title info entry
+        staged.title_info_entry = b''.join([
+            # title size
+            title_size.to_bytes(8, 'little'),
+            # title type, seems to usually be 0x40
+            0x40.to_bytes(4, 'little'),
+            # title version
+            int(cia.tmd.title_version).to_bytes(2, 'little'),
+            # ncch version
+            cia.contents[0].version.to_bytes(2, 'little'),
+            # flags_0, only checking if there is a manual
+            (1 if has_manual else 0).to_bytes(4, 'little'),
+            # tmd content id, always starting with 0
+            (0).to_bytes(4, 'little'),
+            # cmd content id
+            cmd_id.to_bytes(4, 'little'),
+            # flags_1, only checking save data
+            (1 if cia.tmd.save_size else 0).to_bytes(4, 'little'),
+            # extdataid low
+            extdata_id[0:4],
+            # reserved
+            b'\0' * 4,
+            # flags_2, only using a common value
+            0x100000000.to_bytes(8, 'little'),
+            # product code
+            cia.contents[0].product_code.encode(
+                'ascii').ljust(0x10, b'\0'),
+            # reserved
+            b'\0' * 0x10,
+            # unknown
+            randint(0, 0xFFFFFFFF).to_bytes(4, 'little'),
+            # reserved
+            b'\0' * 0x2c
+        ])
+
+        staged.seed = get_seed(
+            cia.contents[0].program_id) if cia.contents[0].flags.uses_seed else None
+
+        # everything needed to finish the title without the source, if this install doesn't get to it
+        self._journal_update(staged.title_id, JournalState.Staged,
+                             tmd_hash=tmd_hash(cia),
+                             display_title=display_title,
+                             title_info_entry=staged.title_info_entry.hex(),
+                             seed=staged.seed.hex() if staged.seed else None,
+                             reused=staged.reused,
+                             content_hashes=staged.content_hashes)
+        return staged
+
+    def commit_title(self, staged: 'StagedTitle', cifinish: CIFinishStore, tempdir: str):
+        self.update_status(staged.path, InstallStatus.Finishing)
+        if staged.state is JournalState.Staged:
+            # unchanged contents are taken from the original install before it's removed
+            for content_rel_path in staged.reused:
+                temp_content_path = join(staged.temp_title_root, 'content', content_rel_path)
+                if not isfile(temp_content_path):
+                    rename(join(staged.title_root, 'content', content_rel_path), temp_content_path)
+
+            if isdir(staged.title_root):
+                self.log(f'Removing original install at {staged.title_root}...')
+                rmtree(staged.title_root)
+
+            makedirs(staged.tidhigh_root, exist_ok=True)
+            rename(staged.temp_title_root, staged.title_root)
+            self._journal_update(staged.title_id, JournalState.Renamed)
+
+            if self.content_index:
+                self.content_index.remove_tree(staged.title_root)
+                for content_rel_path, content_hash in staged.content_hashes.items():
+                    self.content_index.set(join(staged.title_root, 'content', content_rel_path),
+                                           bytes.fromhex(content_hash))
+
+        # this is written out at checkpoints and at the end of the install, not for every title
+        if cifinish.set_title(int(staged.title_id, 16), staged.seed):
+            self._journal_promote(JournalState.Renamed, JournalState.CIFinish)
+
+        with open(join(tempdir, staged.title_id), 'wb') as o:
+            o.write(staged.title_info_entry)
+
+    def get_unchanged_header(self, installed_path: str, enc_path: str, co) -> 'Optional[bytes]':
+        """Returns the start of the installed content if it's the same as co, or None if it has to be copied.
+
+        Contents not in the content index are read and hashed once, and added to it.
+        """
+        if not isfile(installed_path) or getsize(installed_path) != co.size:
+            return None
+
+        with open(installed_path, 'rb') as f, self.crypto.create_ctr_io(
+                Keyslot.SD, f, self.crypto.sd_path_to_iv(enc_path)) as d:
+            installed_hash = self.content_index.get(installed_path)
+            if installed_hash is None:
+                self.log(f'Checking installed {enc_path}...')
+                hasher = sha256()
+                left = co.size
+                while left > 0:
+                    data = d.read(min(self.read_size, left))
+                    if not data:
+                        break
+                    hasher.update(data)
+                    left -= len(data)
+                    self._report_progress(co.size - left, co.size)
+                installed_hash = hasher.digest()
+                self.content_index.set(installed_path, installed_hash)
+
+            if installed_hash != co.hash:
+                return None
+            d.seek(0)
+            return d.read(0x200)
+
+    def resume_from_journal(self, sd_path: str):
+        """Picks up titles an interrupted install staged or moved into place, and removes leftover temp directories.
+
+        Returns the titles to commit without staging them again, and the readers that still need staging.
+        """
+        journal = self.journal
+        resumable = {}
+        for title_id, entry in list(journal.entries.items()):
+            state = JournalState(entry['state'])
+            if state is JournalState.Staging or (state is JournalState.Staged
+                                                 and not isdir(join(self.sd, entry['temp_dir']))):
+                # only partly written, this one has to start over
+                journal.remove(title_id)
+                continue
+            resumable[title_id] = entry
+
+        readers = []
+        paths = {}
+        for title, path in self.readers:
+            title_id = title.title_id
+            entry = resumable.get(title_id)
+            if entry and entry['tmd_hash'] != title.tmd_hash:
+                # a different version is being installed now, so the old one doesn't need finishing
+                self.log(f'Discarding unfinished install of {entry["display_title"]}, a different version is queued')
+                if entry['state'] == JournalState.Staged.value:
+                    rmtree(join(self.sd, entry['temp_dir']), ignore_errors=True)
+                journal.remove(title_id)
+                del resumable[title_id]
+                entry = None
+            if entry:
+                paths[title_id] = path
+            else:
+                readers.append((title, path))
+
+        resumed = []
+        for title_id, entry in resumable.items():
+            state = JournalState(entry['state'])
+            path = paths.get(title_id)
+            if state is JournalState.Imported and path is None:
+                journal.remove(title_id)
+                continue
+
+            self.log(f'Resuming install of {entry["display_title"]}...')
+            tid_parts = (title_id[0:8], title_id[8:16])
+            resumed.append(StagedTitle(path=path, title_id=title_id, display_title=entry['display_title'],
+                                       temp_title_root=join(self.sd, entry['temp_dir']),
+                                       title_root=join(sd_path, 'title', *tid_parts),
+                                       tidhigh_root=join(sd_path, 'title', tid_parts[0]),
+                                       title_info_entry=bytes.fromhex(entry['title_info_entry']),
+                                       seed=bytes.fromhex(entry['seed']) if entry['seed'] else None,
+                                       state=state,
+                                       reused=entry.get('reused', []),
+                                       content_hashes=entry.get('content_hashes', {})))
+
+        # anything else is from an install that was stopped before it got far enough to be resumed
+        keep = {entry['temp_dir'] for entry in resumable.values()
+                if entry['state'] == JournalState.Staged.value}
+        for d in scandir(self.sd):
+            if (d.is_dir() and d.name.startswith('ci-install-temp-') and not d.name.endswith('-corrupted')
+                    and d.name not in keep):
+                self.log(f'Removing leftover {d.name}...')
+                rmtree(d.path, ignore_errors=True)
+
+        return resumed, readers
+
+    def _journal_update(self, title_id: str, state: JournalState, **fields):
+        if self.journal:
+            self.journal.update(title_id, state, **fields)
+
+    def _journal_promote(self, old_state: JournalState, new_state: JournalState):
+        if self.journal:
+            self.journal.promote(old_state, new_state)
+
+    def _journal_remove(self, title_id: str):
+        if self.journal:
+            self.journal.remove(title_id)
+
+    def update_status(self, path: 'Optional[Union[PathLike, bytes, str]]', status: InstallStatus):
+        # titles resumed from the journal that aren't queued anymore don't have a path
+        if path is not None:
+            self.event.update_status(path, status)
+
+    def run_save3ds_fuse(self, args: 'List[str]', extra_kwargs: dict):
+        out = subprocess.run(args,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.STDOUT,
+                             encoding='utf-8',
+                             **extra_kwargs)
+        if out.returncode:
+            for l in out.stdout.split('\n'):
+                self.log(l)
+            self.log('Command line:')
+            for l in pformat(out.args).split('\n'):
+                self.log(l)
+            return False
+        return True
+
+    def import_batch(self, pending: 'List[Tuple[str, Union[PathLike, bytes, str], str]]', tempdir: str,
+                     save3ds_fuse_common_args: 'List[str]', extra_kwargs: dict, install_state: dict):
+        self.log(f'Importing {len(pending)} titles into Title Database...')
+        if self.run_save3ds_fuse(save3ds_fuse_common_args + ['-i'], extra_kwargs):
+            for title_id, path, display_title in pending:
+                self._journal_update(title_id, JournalState.Imported)
+                install_state['installed'].append(display_title)
+                self.update_status(path, InstallStatus.Done)
+            return
+
+        # one of the entries might be the problem, so fall back to importing each title on its own.
+        # the pending entries are taken out of the directory first so a bad one doesn't break the rest.
+        self.log('Batch import failed, importing titles one at a time...', 1)
+        entries = {}
+        for title_id, _, _ in pending:
+            entry_path = join(tempdir, title_id)
+            with open(entry_path, 'rb') as f:
+                entries[title_id] = f.read()
+            remove(entry_path)
+
+        for title_id, path, display_title in pending:
+            entry_path = join(tempdir, title_id)
+            with open(entry_path, 'wb') as o:
+                o.write(entries[title_id])
+
+            self.log(f'Importing {display_title} into Title Database...')
+            if self.run_save3ds_fuse(save3ds_fuse_common_args + ['-i'], extra_kwargs):
+                self._journal_update(title_id, JournalState.Imported)
+                install_state['installed'].append(display_title)
+                self.update_status(path, InstallStatus.Done)
+            else:
+                remove(entry_path)
+                install_state['failed'].append(display_title)
+                self.update_status(path, InstallStatus.Failed)
+
     def get_sd_path(self):
         sd_path = join(self.sd, 'Nintendo 3DS', self.crypto.id0.hex())
         id1s = []
@@ -739,6 +1295,29 @@ if __name__ == "__main__":
         '--overwrite-saves', help='overwrite existing save files', action='store_true')
     parser.add_argument(
         '--cifinish-out', help='path for cifinish.bin file, defaults to (SD root)/cifinish.bin')
+    parser.add_argument(
+        '--read-size', help=f'block size used when copying contents, defaults to {READ_SIZE:#x}',
+        type=lambda x: int(x, 0), default=READ_SIZE)
+    parser.add_argument(
+        '--pipeline-depth', help=f'blocks buffered between the read, encrypt and write stages of a copy, '
+                                 f'0 to copy on one thread, defaults to {PIPELINE_DEPTH}',
+        type=int, default=PIPELINE_DEPTH)
+    parser.add_argument(
+        '--workers', help='number of titles to stage at the same time, defaults to 1', type=int, default=1)
+    parser.add_argument(
+        '--sd-writers', help='number of files to write to the SD card at the same time, defaults to 1',
+        type=int, default=1)
+    parser.add_argument(
+        '--skip-unchanged', help='keep contents of installed titles that are the same instead of copying them again',
+        action='store_true')
+    parser.add_argument(
+        '--no-metadata-cache', help="don't use or update the cache of titles read before", action='store_true')
+    parser.add_argument(
+        '--no-resume', help="don't continue an interrupted install, and don't keep a journal for this one",
+        action='store_true')
+    parser.add_argument(
+        '--no-batch-import', help='import each title into the title database as soon as it is installed',
+        action='store_true')
 
     print(
         f'custom-install {CI_VERSION} - https://github.com/ihaveamac/custom-install')
@@ -750,13 +1329,24 @@ if __name__ == "__main__":
                               sd=args.sd,
                               overwrite_saves=args.overwrite_saves,
                               cifinish_out=args.cifinish_out,
-                              skip_contents=(args.skip_contents or False))
+                              skip_contents=(args.skip_contents or False),
+                              batch_import=not args.no_batch_import,
+                              read_size=args.read_size,
+                              pipeline_depth=args.pipeline_depth,
+                              install_workers=args.workers,
+                              sd_writers=args.sd_writers,
+                              resume=not args.no_resume,
+                              skip_unchanged=args.skip_unchanged,
+                              metadata_cache=None if args.no_metadata_cache else TitleMetadataCache())
 
     def log_handle(msg, end='\n'):
         print(msg, end=end)
 
     def percent_handle(total_percent, total_read, size):
-        installer.log(f' {total_percent:>5.1f}%  {
+        if not size:
+            return
+        # total_percent is summed over every title being staged, so show the combined percentage instead
+        installer.log(f' {total_read / size * 100:>5.1f}%  {
                       total_read:>.1f} MiB / {size:.1f} MiB\r', end='')
 
     def error(exc):
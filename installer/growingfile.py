@@ -0,0 +1,156 @@
+# This file is a part of custom-install.py.
+#
+# custom-install is copyright (c) 2019-2020 Ian Burgwin
+# This file is licensed under The MIT License (MIT).
+# You can find the full license text in LICENSE.md in the root of this project.
+
+from io import SEEK_CUR, SEEK_END, SEEK_SET
+from threading import Condition
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import BinaryIO, Callable, Optional
+
+
+class IncompleteFileError(OSError):
+    """The file stopped growing before the data being read was written."""
+
+
+class GrowingFile:
+    """A read-only file object for a file that is still being written, like a download.
+
+    Reads wait until the data they want is written, so a title can be read and installed while it's downloading. The
+    writer calls begin once it opens the file, extend after every write that was flushed, and finish or fail at the
+    end. on_release is called with the path and whether the file is complete, once the writer is done and the reader
+    is closed, so the file can be moved or removed without either of them having it open.
+    """
+
+    def __init__(self, on_release: 'Optional[Callable[[Optional[str], bool], None]]' = None):
+        self.on_release = on_release
+        self.path: 'Optional[str]' = None
+        # None until the writer says
+        self.size: 'Optional[int]' = None
+        self.written = 0
+        self.complete = False
+        self.error: 'Optional[str]' = None
+        self.closed = False
+        self._fp: 'Optional[BinaryIO]' = None
+        self._pos = 0
+        self._released = False
+        self._cond = Condition()
+
+    # writer side
+
+    def begin(self, path: str, size: 'Optional[int]' = None):
+        with self._cond:
+            self.path = path
+            self.size = size
+            self._cond.notify_all()
+
+    def extend(self, written: int):
+        with self._cond:
+            self.written = written
+            self._cond.notify_all()
+
+    def finish(self):
+        with self._cond:
+            self.complete = True
+            self.size = self.written
+            self._cond.notify_all()
+        self._maybe_release()
+
+    def fail(self, error: str):
+        with self._cond:
+            self.error = error
+            self._cond.notify_all()
+        self._maybe_release()
+
+    @property
+    def writer_done(self):
+        return self.complete or self.error is not None
+
+    # reader side
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def writable(self):
+        return False
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset: int, whence: int = SEEK_SET):
+        if whence == SEEK_SET:
+            self._pos = offset
+        elif whence == SEEK_CUR:
+            self._pos += offset
+        elif whence == SEEK_END:
+            self._pos = self._wait_for_size() + offset
+        else:
+            raise ValueError(f'invalid whence ({whence})')
+        return self._pos
+
+    def _wait_for_size(self) -> int:
+        with self._cond:
+            self._cond.wait_for(lambda: self.size is not None or self.writer_done or self.closed)
+            self._check()
+            return self.size
+
+    def _check(self):
+        # only called with the lock held
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+        if self.error is not None and not self.complete:
+            raise IncompleteFileError(self.error)
+
+    def read(self, size: int = -1) -> bytes:
+        with self._cond:
+            if size is None or size < 0:
+                self._cond.wait_for(lambda: self.writer_done or self.closed)
+                self._check()
+                end = self.written
+            else:
+                end = self._pos + size
+                if self.size is not None:
+                    end = min(end, self.size)
+                self._cond.wait_for(lambda: self.written >= end or self.writer_done or self.closed)
+                self._check()
+                end = min(end, self.written)
+            if end <= self._pos:
+                return b''
+            if self._fp is None:
+                self._fp = open(self.path, 'rb')
+
+        self._fp.seek(self._pos)
+        data = self._fp.read(end - self._pos)
+        self._pos += len(data)
+        return data
+
+    def close(self):
+        with self._cond:
+            if self.closed:
+                return
+            self.closed = True
+            fp, self._fp = self._fp, None
+            self._cond.notify_all()
+        if fp:
+            fp.close()
+        self._maybe_release()
+
+    def _maybe_release(self):
+        with self._cond:
+            if self._released or not (self.closed and self.writer_done):
+                return
+            self._released = True
+        if self.on_release:
+            self.on_release(self.path, self.complete)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,94 @@
+# This file is a part of custom-install.py.
+#
+# custom-install is copyright (c) 2019-2020 Ian Burgwin
+# This file is licensed under The MIT License (MIT).
+# You can find the full license text in LICENSE.md in the root of this project.
+
+import json
+from enum import Enum
+from os import remove, replace
+from threading import Lock
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from os import PathLike
+    from typing import Dict, Optional, Union
+
+# name of the journal, in the root of the SD card
+JOURNAL_NAME = 'ci-install-journal.json'
+
+JOURNAL_VERSION = 1
+
+
+class JournalState(Enum):
+    # the title is being written to its temp directory
+    Staging = 'staging'
+    # every file of the title is in its temp directory
+    Staged = 'staged'
+    # the temp directory was moved to the title directory
+    Renamed = 'renamed'
+    # the title's entry was written to cifinish.bin
+    CIFinish = 'cifinish'
+    # the title's Title Info Entry was imported into title.db
+    Imported = 'imported'
+
+
+class InstallJournal:
+    """Records how far each title got in an install, so an interrupted install can continue where it stopped.
+
+    The file is rewritten on every change and deleted once there is nothing left in it.
+    """
+
+    def __init__(self, path: 'Union[PathLike, str]'):
+        self.path = path
+        self._lock = Lock()
+        self.entries: 'Dict[str, dict]' = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == JOURNAL_VERSION:
+                self.entries = data['titles']
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, AttributeError):
+            # a broken journal can't be trusted, anything it pointed to gets cleaned up as leftovers
+            self.entries = {}
+
+    def state(self, title_id: str) -> 'Optional[JournalState]':
+        try:
+            return JournalState(self.entries[title_id]['state'])
+        except KeyError:
+            return None
+
+    def update(self, title_id: str, state: JournalState, **fields):
+        with self._lock:
+            entry = self.entries.setdefault(title_id, {})
+            entry.update(fields)
+            entry['state'] = state.value
+            self._save()
+
+    def promote(self, old_state: JournalState, new_state: JournalState):
+        with self._lock:
+            for entry in self.entries.values():
+                if entry['state'] == old_state.value:
+                    entry['state'] = new_state.value
+            self._save()
+
+    def remove(self, *title_ids: str):
+        with self._lock:
+            for title_id in title_ids:
+                self.entries.pop(title_id, None)
+            self._save()
+
+    def _save(self):
+        if not self.entries:
+            try:
+                remove(self.path)
+            except FileNotFoundError:
+                pass
+            return
+
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': JOURNAL_VERSION, 'titles': self.entries}, f)
+        replace(temp_path, self.path)
@@ -0,0 +1,137 @@
+# This file is a part of custom-install.py.
+#
+# custom-install is copyright (c) 2019-2020 Ian Burgwin
+# This file is licensed under The MIT License (MIT).
+# You can find the full license text in LICENSE.md in the root of this project.
+
+import json
+from dataclasses import asdict
+from hashlib import sha256
+from os import fspath, makedirs, replace, stat
+from os.path import abspath, dirname, isdir, join
+from threading import Lock
+from time import time
+from typing import TYPE_CHECKING
+
+from installer.readerpool import ContentRecord, TitleDescriptor
+from utils import get_cache_dir
+
+if TYPE_CHECKING:
+    from os import PathLike
+    from typing import Dict, Optional, Union
+
+METADATA_CACHE_NAME = 'title-metadata.json'
+
+METADATA_CACHE_VERSION = 1
+
+# entries not used for this long are dropped when the cache is saved, in seconds
+METADATA_CACHE_MAX_AGE = 90 * 24 * 60 * 60
+
+# most entries to keep, the least recently used ones are dropped first
+METADATA_CACHE_MAX_ENTRIES = 10000
+
+# how much of the start of a file is hashed when check_header is on.
+# this covers the CIA header, certificate chain, ticket and most of the TMD.
+HEADER_HASH_SIZE = 0x10000
+
+
+def default_metadata_cache_path():
+    return join(get_cache_dir(), METADATA_CACHE_NAME)
+
+
+class TitleMetadataCache:
+    """Keeps TitleDescriptors of titles that were read before, so adding them again doesn't need to parse them.
+
+    Entries are keyed by path, and only used while the file has the same size and mtime (and the same first
+    HEADER_HASH_SIZE bytes, if check_header is on). For CDN titles, the tmd file is checked.
+    """
+
+    def __init__(self, path: 'Optional[str]' = None, *, check_header: bool = False):
+        self.path = path or default_metadata_cache_path()
+        self.check_header = check_header
+        self._lock = Lock()
+        self.changed = False
+        self.entries: 'Dict[str, dict]' = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == METADATA_CACHE_VERSION:
+                self.entries = data['titles']
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, AttributeError):
+            self.entries = {}
+
+    @staticmethod
+    def _key(path: 'Union[PathLike, str]'):
+        return abspath(fspath(path))
+
+    def _fingerprint(self, path: 'Union[PathLike, str]'):
+        path = fspath(path)
+        if isdir(path):
+            path = join(path, 'tmd')
+        st = stat(path)
+        fingerprint = {'size': st.st_size, 'mtime': st.st_mtime_ns}
+        if self.check_header:
+            with open(path, 'rb') as f:
+                fingerprint['header'] = sha256(f.read(HEADER_HASH_SIZE)).hexdigest()
+        return fingerprint
+
+    def get(self, path: 'Union[PathLike, str]') -> 'Optional[TitleDescriptor]':
+        key = self._key(path)
+        with self._lock:
+            entry = self.entries.get(key)
+        if not entry:
+            return None
+        try:
+            fingerprint = self._fingerprint(path)
+        except OSError:
+            fingerprint = None
+        with self._lock:
+            if fingerprint != entry['fingerprint']:
+                # the file changed or is gone
+                self.entries.pop(key, None)
+                self.changed = True
+                return None
+            entry['used'] = time()
+            self.changed = True
+
+        title = dict(entry['title'])
+        title['contents'] = [ContentRecord(**c) for c in title['contents']]
+        return TitleDescriptor(path=path, **title)
+
+    def put(self, path: 'Union[PathLike, str]', title: TitleDescriptor):
+        try:
+            fingerprint = self._fingerprint(path)
+        except OSError:
+            return
+        title_data = asdict(title)
+        del title_data['path']
+        with self._lock:
+            self.entries[self._key(path)] = {'fingerprint': fingerprint, 'used': time(), 'title': title_data}
+            self.changed = True
+
+    def save(self):
+        with self._lock:
+            if not self.changed:
+                return
+            oldest = time() - METADATA_CACHE_MAX_AGE
+            entries = sorted(((k, v) for k, v in self.entries.items() if v['used'] >= oldest),
+                             key=lambda item: item[1]['used'], reverse=True)
+            self.entries = dict(entries[:METADATA_CACHE_MAX_ENTRIES])
+
+            try:
+                makedirs(dirname(self.path), exist_ok=True)
+                temp_path = self.path + '.tmp'
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'version': METADATA_CACHE_VERSION, 'titles': self.entries}, f)
+                replace(temp_path, self.path)
+            except OSError:
+                # not being able to cache isn't a reason to stop anything
+                return
+            self.changed = False
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.changed = True
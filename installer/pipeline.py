@@ -0,0 +1,168 @@
+# This file is a part of custom-install.py.
+#
+# custom-install is copyright (c) 2019-2020 Ian Burgwin
+# This file is licensed under The MIT License (MIT).
+# You can find the full license text in LICENSE.md in the root of this project.
+
+from contextlib import ExitStack, nullcontext
+from hashlib import sha256
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from typing import TYPE_CHECKING, BinaryIO
+
+if TYPE_CHECKING:
+    from typing import Callable, ContextManager, List, Optional
+
+# size to read at a time when copying files
+READ_SIZE = 0x200000
+
+# how many blocks a stage can get ahead of the next one
+PIPELINE_DEPTH = 4
+
+# how long a stage waits on a queue before checking if the copy was aborted
+_POLL_INTERVAL = 0.1
+
+# marks the end of the stream in a queue
+_DONE = object()
+
+# shared source for write_zeros, so writing a blank file never allocates more than this
+_ZERO_BLOCK = memoryview(bytes(READ_SIZE))
+
+
+class _Aborted(Exception):
+    pass
+
+
+def copy_sequential(src: BinaryIO, dst: BinaryIO, size: int, cipher, *, block_size: int = READ_SIZE,
+                    progress: 'Optional[Callable[[int], None]]' = None,
+                    write_slot: 'Optional[ContextManager]' = None, head_size: int = 0):
+    left = size
+    hasher = sha256()
+    head = b''
+    with write_slot or nullcontext():
+        while left > 0:
+            to_read = min(block_size, left)
+            data = src.read(to_read)
+            hasher.update(data)
+            if len(head) < head_size:
+                head += data[:head_size - len(head)]
+            dst.write(cipher.encrypt(data))
+            left -= to_read
+            if progress:
+                progress(size - left)
+
+    return hasher.digest(), head
+
+
+def write_zeros(dst: BinaryIO, size: int):
+    """Writes size zero bytes in READ_SIZE chunks from one shared buffer."""
+    left = size
+    while left > 0:
+        to_write = min(READ_SIZE, left)
+        dst.write(_ZERO_BLOCK[:to_write])
+        left -= to_write
+
+
+def copy_pipelined(src: BinaryIO, dst: BinaryIO, size: int, cipher, *, block_size: int = READ_SIZE,
+                   depth: int = PIPELINE_DEPTH, progress: 'Optional[Callable[[int], None]]' = None,
+                   write_slot: 'Optional[ContextManager]' = None, head_size: int = 0):
+    """Copies while hashing and encrypting, with the read, hash+encrypt and write stages on separate threads.
+
+    hashlib, the AES backend and file IO all release the GIL, so this runs at about the speed of the slowest stage
+    instead of the sum of all of them. The write stage runs on the calling thread, so progress is reported from there.
+    If write_slot is given, it is held from the first write to the end, so the other stages can get ahead while
+    another copy is writing. Returns the SHA-256 of the source data and its first head_size bytes, so anything
+    needing the start of the data doesn't have to read it again.
+    """
+    if depth < 1 or size <= block_size:
+        # nothing to overlap
+        return copy_sequential(src, dst, size, cipher, block_size=block_size, progress=progress,
+                               write_slot=write_slot, head_size=head_size)
+
+    read_queue = Queue(depth)
+    write_queue = Queue(depth)
+    abort = Event()
+    errors: 'List[BaseException]' = []
+    hasher = sha256()
+    head = b''
+
+    def put(q: Queue, item):
+        while True:
+            if abort.is_set():
+                raise _Aborted
+            try:
+                q.put(item, timeout=_POLL_INTERVAL)
+                return
+            except Full:
+                pass
+
+    def get(q: Queue):
+        while True:
+            if abort.is_set():
+                raise _Aborted
+            try:
+                return q.get(timeout=_POLL_INTERVAL)
+            except Empty:
+                pass
+
+    def run_stage(func):
+        def stage():
+            try:
+                func()
+            except _Aborted:
+                pass
+            except BaseException as e:
+                errors.append(e)
+                abort.set()
+        return Thread(target=stage, daemon=True)
+
+    def read_stage():
+        left = size
+        while left > 0:
+            to_read = min(block_size, left)
+            put(read_queue, (src.read(to_read), to_read))
+            left -= to_read
+        put(read_queue, _DONE)
+
+    def crypt_stage():
+        nonlocal head
+        while True:
+            item = get(read_queue)
+            if item is _DONE:
+                put(write_queue, _DONE)
+                return
+            data, to_read = item
+            hasher.update(data)
+            if len(head) < head_size:
+                head += data[:head_size - len(head)]
+            put(write_queue, (cipher.encrypt(data), to_read))
+
+    threads = [run_stage(read_stage), run_stage(crypt_stage)]
+    for t in threads:
+        t.start()
+
+    try:
+        with ExitStack() as slot:
+            total_read = 0
+            while True:
+                item = get(write_queue)
+                if item is _DONE:
+                    break
+                if write_slot and not total_read:
+                    slot.enter_context(write_slot)
+                data, to_read = item
+                dst.write(data)
+                total_read += to_read
+                if progress:
+                    progress(total_read)
+    except _Aborted:
+        pass
+    finally:
+        abort.set()
+        for t in threads:
+            t.join()
+
+    if errors:
+        raise errors[0]
+
+    return hasher.digest(), head
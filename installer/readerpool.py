@@ -0,0 +1,127 @@
+# This file is a part of custom-install.py.
+#
+# custom-install is copyright (c) 2019-2020 Ian Burgwin
+# This file is licensed under The MIT License (MIT).
+# You can find the full license text in LICENSE.md in the root of this project.
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from os import PathLike
+    from typing import Callable, List, Union
+
+    from pyctr.type.cdn import CDNReader
+    from pyctr.type.cia import CIAReader
+
+# readers kept open at once, unless more than this are in use
+MAX_OPEN_READERS = 16
+
+
+@dataclass
+class ContentRecord:
+    cindex: int
+    id: str
+    size: int
+    # sha256 of the decrypted content, in hex
+    hash: str
+
+
+@dataclass
+class TitleDescriptor:
+    """What is needed about a queued title before it's installed, so its reader doesn't have to stay open."""
+    path: 'Union[PathLike, bytes, str]'
+    title_id: str
+    title_name: str
+    install_size: int
+    # sha256 of the tmd, to tell versions of a title apart
+    tmd_hash: str
+    uses_seed: bool = False
+    contents: 'List[ContentRecord]' = field(default_factory=list)
+
+
+class _PoolEntry:
+    __slots__ = ('reader', 'users')
+
+    def __init__(self, reader: 'Union[CIAReader, CDNReader]'):
+        self.reader = reader
+        self.users = 0
+
+
+class ReaderPool:
+    """Opens readers when they are needed, and keeps the most recently used ones open up to max_open.
+
+    Readers in use by open() are never closed, so there can be more than max_open open if that many are in use.
+    """
+
+    def __init__(self, opener: 'Callable[[Union[PathLike, bytes, str]], Union[CIAReader, CDNReader]]',
+                 max_open: int = MAX_OPEN_READERS):
+        self.opener = opener
+        self.max_open = max_open
+        self._lock = Lock()
+        self._entries: 'OrderedDict[Union[PathLike, bytes, str], _PoolEntry]' = OrderedDict()
+
+    @contextmanager
+    def open(self, path: 'Union[PathLike, bytes, str]'):
+        entry = self._acquire(path)
+        try:
+            yield entry.reader
+        finally:
+            with self._lock:
+                entry.users -= 1
+                self._evict()
+
+    def add(self, path: 'Union[PathLike, bytes, str]', reader: 'Union[CIAReader, CDNReader]'):
+        """Puts a reader that is already open in the pool."""
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old and old.reader is not reader:
+                old.reader.close()
+            self._entries[path] = _PoolEntry(reader)
+            self._evict()
+
+    def discard(self, path: 'Union[PathLike, bytes, str]'):
+        with self._lock:
+            entry = self._entries.pop(path, None)
+        if entry:
+            entry.reader.close()
+
+    def close(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            entry.reader.close()
+
+    def _acquire(self, path: 'Union[PathLike, bytes, str]') -> _PoolEntry:
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry:
+                self._entries.move_to_end(path)
+                entry.users += 1
+                return entry
+
+        # opened without the lock, so parsing one title doesn't hold up the others
+        reader = self.opener(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry:
+                # someone else opened it in the meantime
+                reader.close()
+            else:
+                entry = self._entries[path] = _PoolEntry(reader)
+            self._entries.move_to_end(path)
+            entry.users += 1
+            self._evict()
+            return entry
+
+    def _evict(self):
+        # least recently used first
+        extra = len(self._entries) - self.max_open
+        if extra <= 0:
+            return
+        for path in [p for p, e in self._entries.items() if not e.users][:extra]:
+            self._entries.pop(path).reader.close()
@@ -0,0 +1,70 @@
+# This file is a part of custom-install.py.
+#
+# custom-install is copyright (c) 2019-2020 Ian Burgwin
+# This file is licensed under The MIT License (MIT).
+# You can find the full license text in LICENSE.md in the root of this project.
+
+from dataclasses import dataclass, field
+from hashlib import sha256
+from struct import error as StructError
+from typing import TYPE_CHECKING
+
+from pyctr.common import PyCTRError
+from pyctr.crypto import BootromNotFoundError, KeyslotMissingError
+from pyctr.type.cia import CIAReader
+
+if TYPE_CHECKING:
+    from typing import Callable, List, Optional
+
+VERIFY_READ_SIZE = 0x100000
+
+
+@dataclass
+class CIAVerifyResult:
+    path: str
+    # bytes of content that were hashed
+    size: int = 0
+    # IDs of the contents whose hash isn't the one in the TMD
+    bad_contents: 'List[str]' = field(default_factory=list)
+    # why the CIA couldn't be read at all
+    error: 'Optional[str]' = None
+
+    @property
+    def ok(self):
+        return self.error is None and not self.bad_contents
+
+
+def verify_cia(path: str, on_progress: 'Optional[Callable[[int], None]]' = None,
+               read_size: int = VERIFY_READ_SIZE) -> CIAVerifyResult:
+    """Checks every content of a CIA against the hash in its TMD, reading the file once from start to end.
+
+    on_progress is called with the number of bytes hashed so far. The title key is needed to decrypt the contents,
+    so this raises KeyslotMissingError or BootromNotFoundError without boot9, which says nothing about the file.
+    """
+    result = CIAVerifyResult(path)
+    try:
+        reader = CIAReader(path, load_contents=False)
+    except (KeyslotMissingError, BootromNotFoundError):
+        raise
+    except (PyCTRError, StructError, ValueError, EOFError) as e:
+        result.error = f'Not a valid CIA: {type(e).__name__}: {e}'
+        return result
+
+    with reader:
+        # contents are stored in the order of the content info, so this goes through the file in order
+        for co in reader.content_info:
+            hasher = sha256()
+            left = co.size
+            with reader.open_raw_section(co.cindex) as f:
+                while left > 0:
+                    data = f.read(min(read_size, left))
+                    if not data:
+                        break
+                    hasher.update(data)
+                    left -= len(data)
+                    result.size += len(data)
+                    if on_progress:
+                        on_progress(result.size)
+            if left or hasher.digest() != co.hash:
+                result.bad_contents.append(co.id)
+    return result
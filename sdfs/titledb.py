@@ -0,0 +1,168 @@
+from io import BytesIO
+from struct import Struct
+from typing import TYPE_CHECKING
+
+from pyctr.common import PyCTRError
+from pyctr.crypto import Keyslot
+from pyctr.type.save.diff import DIFF
+from pyctr.type.save.partdesc.ivfc import IVFCLevel4Reader
+
+from sdfs.types import TitleInfoEntry
+
+if TYPE_CHECKING:
+    from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+    from pyctr.crypto import CryptoEngine
+    from pyctr.type.sd import SDFilesystem
+
+# the database starts with one of these, then the BDRI filesystem at 0x80
+TITLE_DB_MAGICS = (b'NANDTDB\0', b'TEMPTDB\0', b'NANDIDB\0', b'TEMPIDB\0')
+BDRI_OFFSET = 0x80
+
+_BDRI_HEADER = Struct('<4sI Q QI4x')
+_FS_INFO = Struct('<II QI4x QI4x QI4x QI4x II I4x II I4x')
+_FILE_ENTRY = Struct('<IQII I Q8xI')
+_FAT_ENTRY = Struct('<II')
+
+# the FAT marks the first node of a chain, and nodes that are longer than one block, with the high bit
+_FAT_FLAG = 0x80000000
+
+# title IDs of applications that can be launched from the HOME Menu, not updates or DLC
+APPLICATION_PREFIX = '00040000'
+
+
+class TitleDatabaseError(PyCTRError):
+    """The title database couldn't be read."""
+
+
+class TitleDatabase:
+    """Reads the Title Info Entries in a title database (title.db or import.db), without extracting it.
+
+    fp has to be the decrypted DIFF file. Only the filesystem metadata and the entries are read from it.
+    """
+
+    def __init__(self, fp: 'BinaryIO', crypto: 'CryptoEngine'):
+        try:
+            self._diff = DIFF(fp, crypto=crypto)
+            self._fp = IVFCLevel4Reader(self._diff.partitions[0].ivfc_hash_tree)
+        except (PyCTRError, ValueError) as e:
+            raise TitleDatabaseError(f'Not a valid DIFF container: {e}') from e
+
+        pre_header = self._read(0, 8)
+        if pre_header not in TITLE_DB_MAGICS:
+            raise TitleDatabaseError(f'Not a title database: {pre_header!r}')
+
+        magic, version, fs_info_offset, _, _ = _BDRI_HEADER.unpack(self._read(BDRI_OFFSET, _BDRI_HEADER.size))
+        if magic != b'BDRI' or version != 0x30000:
+            raise TitleDatabaseError(f'BDRI magic expected, got {magic!r} version {version:#x}')
+
+        (_, self._block_size,
+         _, _,
+         file_hash_offset, file_bucket_count,
+         fat_offset, fat_entry_count,
+         data_offset, _,
+         _, _, _,
+         file_table_block, _, _) = _FS_INFO.unpack(self._read(BDRI_OFFSET + fs_info_offset, _FS_INFO.size))
+        self._data_offset = BDRI_OFFSET + data_offset
+
+        buckets = self._read(BDRI_OFFSET + file_hash_offset, file_bucket_count * 4)
+        self._buckets = [int.from_bytes(buckets[i:i + 4], 'little') for i in range(0, len(buckets), 4)]
+        fat = self._read(BDRI_OFFSET + fat_offset, fat_entry_count * _FAT_ENTRY.size)
+        self._fat = list(_FAT_ENTRY.iter_unpack(fat))
+
+        # the file entry table is small, so it's read once
+        self._file_table = self._read_chain(file_table_block)
+        self._files = self._load_files()
+
+    @classmethod
+    def from_sd(cls, fs: 'SDFilesystem', crypto: 'CryptoEngine', path: str = '/dbs/title.db', *,
+                id1: 'Optional[str]' = None):
+        """Opens a database on an SD card, through an SDFilesystem made with crypto."""
+        with fs.open(path, id1=id1) as f:
+            # one sequential read of the whole file is a lot faster on an SD card than many small ones
+            data = f.read()
+        return cls(BytesIO(data), crypto)
+
+    @classmethod
+    def from_file(cls, path: str, crypto: 'CryptoEngine', sd_path: str = '/dbs/title.db'):
+        """Opens an SD-encrypted database by its real path. sd_path is its path under id1, used for the IV."""
+        with open(path, 'rb') as f:
+            cipher = crypto.create_ctr_cipher(Keyslot.SD, crypto.sd_path_to_iv(sd_path))
+            data = cipher.decrypt(f.read())
+        return cls(BytesIO(data), crypto)
+
+    def _read(self, offset: int, size: int) -> bytes:
+        self._fp.seek(offset)
+        data = self._fp.read(size)
+        if len(data) != size:
+            raise TitleDatabaseError(f'Database ended early, wanted {size:#x} bytes at {offset:#x}')
+        return data
+
+    def _chain_blocks(self, first_block: int) -> 'List[Tuple[int, int]]':
+        """Returns the (first, last) blocks of every node in the chain that starts at first_block."""
+        nodes = []
+        index = first_block + 1
+        seen = set()
+        while index:
+            if index in seen or index >= len(self._fat):
+                raise TitleDatabaseError(f'Broken allocation chain at block {first_block}')
+            seen.add(index)
+            _, v = self._fat[index]
+            last = index
+            if v & _FAT_FLAG:
+                last = self._fat[index + 1][1] & ~_FAT_FLAG
+            nodes.append((index - 1, last - 1))
+            index = v & ~_FAT_FLAG
+        return nodes
+
+    def _read_chain(self, first_block: int, size: 'Optional[int]' = None) -> bytes:
+        parts = []
+        for first, last in self._chain_blocks(first_block):
+            parts.append(self._read(self._data_offset + first * self._block_size,
+                                    (last - first + 1) * self._block_size))
+        data = b''.join(parts)
+        return data if size is None else data[:size]
+
+    def _load_files(self) -> 'Dict[str, Tuple[int, int]]':
+        # every file is in one of the hash buckets, while free entries aren't
+        files = {}
+        count = len(self._file_table) // _FILE_ENTRY.size
+        for index in self._buckets:
+            while index:
+                if index >= count or len(files) > count:
+                    raise TitleDatabaseError(f'Broken file entry table at entry {index}')
+                _, title_id, _, _, block, size, index = _FILE_ENTRY.unpack_from(
+                    self._file_table, index * _FILE_ENTRY.size)
+                files[f'{title_id:016X}'] = (block, size)
+        return files
+
+    def __len__(self):
+        return len(self._files)
+
+    def __contains__(self, title_id: str):
+        return title_id.upper() in self._files
+
+    def title_ids(self) -> 'List[str]':
+        return list(self._files)
+
+    def get(self, title_id: str) -> 'Optional[TitleInfoEntry]':
+        location = self._files.get(title_id.upper())
+        if location is None:
+            return None
+        return TitleInfoEntry.from_bytes(self._read_chain(*location))
+
+    def entries(self) -> 'Iterator[Tuple[str, TitleInfoEntry]]':
+        for title_id, location in self._files.items():
+            yield title_id, TitleInfoEntry.from_bytes(self._read_chain(*location))
+
+    def count_applications(self):
+        return sum(1 for title_id in self._files if title_id.startswith(APPLICATION_PREFIX))
+
+    def close(self):
+        self._diff.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -2,14 +2,18 @@
 import os
 import subprocess
 import sys
+from dataclasses import dataclass
 from os.path import dirname, isfile, join
+from struct import error as struct_error
 from sys import executable, platform
 from tempfile import TemporaryDirectory
 
+from pyctr.common import PyCTRError
 from pyctr.crypto import CryptoEngine
 from pyctr.type.sd import SDFilesystem
 
-from sdfs.types import InstalledTitle
+from sdfs.titledb import TitleDatabase
+from sdfs.types import InstalledTitle, TitleInfoEntry
 
 frozen = getattr(sys, 'frozen', None)
 is_windows = sys.platform == 'win32'
@@ -36,14 +40,45 @@ def get_app_title(title_id: str, fs: SDFilesystem):
     return title.contents[0].exefs.icon.get_app_title()
 
 
-def collect_existing_titles(boot9: str, movable: str, root_sd_path: str):
+@dataclass
+class SDTitles:
+    """The titles in an SD card's title.db, and what is needed to open them."""
+    crypto: CryptoEngine
+    fs: SDFilesystem
+    # title ID -> its Title Info Entry, None if it couldn't be read
+    entries: dict[str, TitleInfoEntry | None]
+
+    @property
+    def title_ids(self):
+        return list(self.entries)
+
+
+def read_sd_titles(boot9: str, movable: str, root_sd_path: str) -> SDTitles:
+    """Reads the title IDs and Title Info Entries of everything installed on an SD card.
+
+    title.db is read directly, or extracted with save3ds_fuse if that fails. The same keys are used for everything
+    after.
+    """
     crypto = CryptoEngine(boot9=boot9)
     crypto.setup_sd_key_from_file(movable)
-    d = SDFilesystem(join(root_sd_path, 'Nintendo 3DS'), crypto=crypto)
+    fs = SDFilesystem(join(root_sd_path, 'Nintendo 3DS'), crypto=crypto)
+    try:
+        with TitleDatabase.from_sd(fs, crypto) as db:
+            entries = dict(db.entries())
+    except (PyCTRError, OSError) as e:
+        print(f'Could not read title.db directly ({type(e).__name__}: {e}), extracting it instead')
+        entries = _extract_title_info_entries(crypto, movable, root_sd_path)
+    return SDTitles(crypto, fs, entries)
+
+
+def collect_existing_titles(boot9: str, movable: str, root_sd_path: str, sd_titles: SDTitles | None = None):
+    if sd_titles is None:
+        sd_titles = read_sd_titles(boot9, movable, root_sd_path)
+    d = sd_titles.fs
     dlc_byte = '8C'
     update_byte = '0E'
     game_byte = '00'
-    title_ids = get_existing_title_ids(boot9, movable, root_sd_path)
+    title_ids = sd_titles.title_ids
 
     BYTE_RANGE_START = 6
     BYTE_RANGE_END = 8
@@ -57,7 +92,7 @@ def collect_existing_titles(boot9: str, movable: str, root_sd_path: str):
     titles: dict[str, InstalledTitle] = {}
     for game in game_ids:
         titles[game] = InstalledTitle(
-            game, get_app_title(game, d), None, None)
+            game, get_app_title(game, d), None, None, sd_titles.entries[game])
 
     for update in update_ids:
         related_game = update
@@ -83,6 +118,11 @@ def collect_existing_titles(boot9: str, movable: str, root_sd_path: str):
 
 
 def get_existing_title_ids(boot9, movable, root_sd_path) -> list[str]:
+    return read_sd_titles(boot9, movable, root_sd_path).title_ids
+
+
+def _extract_title_info_entries(crypto: CryptoEngine, movable: str,
+                                root_sd_path: str) -> dict[str, TitleInfoEntry | None]:
     if frozen:
         save3ds_fuse_path = join(script_dir, 'bin', 'save3ds_fuse')
     else:
@@ -91,38 +131,38 @@ def get_existing_title_ids(boot9, movable, root_sd_path) -> list[str]:
         save3ds_fuse_path += '.exe'
     if not isfile(save3ds_fuse_path):
         print("Couldn't find " + save3ds_fuse_path, 2)
-        return []
-
-    crypto = CryptoEngine(boot9=boot9)
-    crypto.setup_sd_key_from_file(movable)
-
-    d = SDFilesystem(join(root_sd_path, 'Nintendo 3DS'),
-                     crypto=crypto)
+        return {}
 
     with TemporaryDirectory(suffix='-custom-install') as tempdir:
-        # set up the common arguments for the two times we call save3ds_fuse
-        save3ds_fuse_common_args = [
+        save3ds_fuse_args = [
             save3ds_fuse_path,
             '-b', crypto.b9_path,
             '-m', movable,
             '--sd', root_sd_path,
             '--db', 'sdtitle',
-            tempdir
+            tempdir,
+            '-x'
         ]
 
         extra_kwargs = {}
         if is_windows:
             extra_kwargs['creationflags'] = 0x08000000  # CREATE_NO_WINDOW
 
-        out = subprocess.run(save3ds_fuse_common_args + ['-x'],
+        out = subprocess.run(save3ds_fuse_args,
                              stdout=subprocess.PIPE,
                              stderr=subprocess.STDOUT,
                              encoding='utf-8',
                              **extra_kwargs)
-        titles = []
+        entries = {}
         for l in out.stdout.split('\n'):
             if len(l) != 17:
                 continue
 
-            titles.append(l[1:].upper())
-        return list(set(titles))
+            # each title's entry is extracted to a file named after it
+            try:
+                with open(join(tempdir, l[1:]), 'rb') as f:
+                    entry = TitleInfoEntry.from_bytes(f.read())
+            except (OSError, struct_error):
+                entry = None
+            entries[l[1:].upper()] = entry
+        return entries
@@ -1,11 +1,38 @@
 from dataclasses import dataclass
+from struct import Struct
 
 from pyctr.type.smdh import AppTitle
 
+# the layout of a title info entry in title.db, the same one the installer writes
+_TITLE_INFO_ENTRY = Struct('<QIHHIIIII4xQ16s16x4x44x')
+
+
+@dataclass
+class TitleInfoEntry:
+    title_size: int
+    title_type: int
+    title_version: int
+    ncch_version: int
+    flags_0: int
+    tmd_content_id: int
+    cmd_content_id: int
+    flags_1: int
+    extdata_id_low: int
+    flags_2: int
+    product_code: str
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        fields = list(_TITLE_INFO_ENTRY.unpack_from(data))
+        fields[-1] = fields[-1].rstrip(b'\0').decode('ascii', errors='replace')
+        return cls(*fields)
+
 
 @dataclass
 class InstalledTitle:
     id: str
-    title: AppTitle
+    # None if the title has no icon to read it from
+    title: AppTitle | None
     update_id: str | None
     dlc_id: str | None
+    info: TitleInfoEntry | None = None
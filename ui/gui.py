@@ -4,15 +4,16 @@
 # This file is licensed under The MIT License (MIT).
 # You can find the full license text in LICENSE.md in the root of this project.
 
-import asyncio
 import os
 import sys
 import tkinter as tk
 import tkinter.filedialog as fd
 import tkinter.messagebox as mb
 import tkinter.ttk as ttk
+from concurrent.futures import ThreadPoolExecutor
 from os import environ, scandir
 from os.path import abspath, basename, dirname, isfile, join
+from queue import Empty, Queue
 from threading import Lock, Thread
 from time import strftime
 from traceback import format_exception
@@ -25,11 +26,15 @@ from pyctr.type.cia import CIAError
 from pyctr.type.tmd import TitleMetadataError
 from pyctr.util import config_dirs
 
-from hshop.data import find_candidate_linked_content, find_hshop_title
-from hshop.parse import _compile_meta_node
-from installer.custominstall import (CustomInstall, InvalidCIFinishError,
-                                     load_cifinish)
-from sdfs.titles import collect_existing_titles, get_existing_title_ids
+from hshop.data import (find_candidate_linked_content, find_hshop_title,
+                        search_hshop)
+from hshop.download import DOWNLOAD_DIR, DownloadManager, DownloadStatus
+from hshop.ledger import open_ledger
+from installer.custominstall import (CustomInstall, InstallSizeIndex,
+                                     InvalidCIFinishError, describe_path,
+                                     load_cifinish, open_cia_stream)
+from installer.metacache import TitleMetadataCache
+from installer.readerpool import ReaderPool, TitleDescriptor
 from ui.frames.ConsoleFrame import ConsoleFrame
 from ui.frames.InstallResults import InstallResults
 from ui.frames.TitleReadFailResults import TitleReadFailResults
@@ -39,7 +44,10 @@ from utils import CI_VERSION, InstallStatus
 
 if TYPE_CHECKING:
     from os import PathLike
-    from typing import Union
+    from typing import Callable, Dict, Iterable, Optional, Tuple, Union
+
+    from hshop.download import DownloadProgress
+    from installer.growingfile import GrowingFile
 
 frozen = getattr(sys, 'frozen', None)
 
@@ -66,6 +74,29 @@ default_movable_sed_path = find_first_file([join(file_parent, 'movable.sed')])
 if default_seeddb_path:
     load_seeddb(default_seeddb_path)
 
+# titles staged at the same time when "Install several titles at once" is checked
+PARALLEL_INSTALL_WORKERS = 3
+
+# titles read at the same time when adding several at once
+ADD_TITLE_WORKERS = 4
+
+# how often titles read in the background are added to the list, in milliseconds
+ADD_TITLE_POLL_INTERVAL = 50
+
+# how often download progress is shown, in milliseconds
+DOWNLOAD_POLL_INTERVAL = 100
+
+# how often install progress is shown, in milliseconds
+INSTALL_POLL_INTERVAL = 100
+
+
+def sizeof_fmt(num, suffix="B"):
+    for unit in ("", "K", "M", "G", "T", "P", "E", "Z"):
+        if abs(num) < 1024.0:
+            return f"{num:3.2f}{unit}{suffix}"
+        num /= 1024.0
+    return f"{num:.1f}Yi{suffix}"
+
 
 class TitleManagerWindow(ttk.Frame):
     console = None
@@ -75,10 +106,20 @@ class TitleManagerWindow(ttk.Frame):
         super().__init__(parent, padding='10')
         self.parent = parent
 
-        # readers to give to CustomInstall at the install
+        # descriptors of the titles to give to CustomInstall at the install.
+        # the readers themselves are only kept open in reader_pool, up to a limit.
         self.readers = {}
+        self.reader_pool = ReaderPool(CustomInstall.get_reader)
+        # titles added in an earlier session don't have to be read again
+        self.metadata_cache = TitleMetadataCache()
+        # install size of each of those, kept with them so starting an install doesn't have to go over all of them
+        self.install_sizes = InstallSizeIndex()
 
         self.lock = Lock()
+        # progress of the install that's running, from create_installer
+        self.install_progress: 'Optional[Queue]' = None
+        # set while run_installer's thread runs, the buttons belong to the install until then
+        self.installing = False
 
         self.log_messages = []
 
@@ -204,45 +245,14 @@ class TitleManagerWindow(ttk.Frame):
         search_frame.rowconfigure(2, weight=1)
 
         def begin_search():
-            import urllib
-
-            import requests
-            from bs4 import BeautifulSoup
             self.search.delete(*self.search.get_children())
-            query_url = f'https://hshop.erista.me/search/results?sd=descending&sb=downloads&q={
-                urllib.parse.quote_plus(self.search_input.get())}&qt=Text&lgy=false'
-            self.search_state.configure(text=f'Fetching {query_url}')
-            query_page = requests.get(query_url)
-            soup = BeautifulSoup(query_page.text, 'html.parser')
-            count = 0
-            for game in soup.find_all(name='a', attrs={
-                    'class': 'list-entry block-link'}):
-                base_info = game.find(name='div', attrs={'class': 'base-info'})
-                if base_info is None:
-                    continue
-                content_spec = base_info.find(name='h4')
-                if content_spec is None:
-                    continue
-
-                content_spec = content_spec.find_all(name='span', attrs={
-                    'class': 'green bold'})
-                if content_spec is None or len(content_spec) != 2:
-                    continue
-                category = content_spec[0].text
-                region = content_spec[1].text
-                game_title = game.find(name='h3', attrs={
-                    'class': 'green bold nospace'})
-                if game_title is None:
-                    continue
-                game_title = game_title.contents[0]
-
-                meta_info = _compile_meta_node(game)
-
-                if meta_info.hshop_id is not None:
-                    count += 1
-                    self.search.insert('', tk.END, iid=meta_info.hshop_id,
-                                       values=(meta_info.title_id, game_title, meta_info.version, f'{category}/{region}', meta_info.size))
-            self.search_state.configure(text=f'Loaded {count} results')
+            query = self.search_input.get()
+            self.search_state.configure(text=f'Searching hShop for {query}')
+            results = search_hshop(query)
+            for r in results:
+                self.search.insert('', tk.END, iid=r.hshop_id,
+                                   values=(r.title_id, r.name, r.version, f'{r.category}/{r.region}', r.size))
+            self.search_state.configure(text=f'Loaded {len(results)} results')
         search_input_frame = ttk.Frame(search_frame)
         search_input_frame.rowconfigure(0, weight=1)
         search_input_frame.grid(row=1, column=0, sticky=tk.NSEW)
@@ -304,6 +314,7 @@ class TitleManagerWindow(ttk.Frame):
                             '', tk.END, iid=a.hshop_id, values=(a.title_id, f'{a.relation_type} for {title_name}'))
             self.queue.insert('', tk.END, text=hshop_id, iid=hshop_id,
                               values=(title_id, title_name))
+            self.save_download_queue()
             self.search_state.configure(
                 text=f'Added {total_inserts} titles to download queue')
         self.search.bind(
@@ -316,104 +327,169 @@ class TitleManagerWindow(ttk.Frame):
         queue_frame.columnconfigure(0, weight=1)
         self.queue = ttk.Treeview(queue_frame)
         self.queue.grid(row=0, column=0, sticky=tk.NSEW)
-        self.queue.config(columns=('id', 'name'), show='headings')
+        self.queue.config(columns=('id', 'name', 'status'), show='headings')
         self.queue.column('id', width=200, anchor=tk.W)
         self.queue.heading('id', text='Title ID')
         self.queue.column('name', width=200, anchor=tk.W)
         self.queue.heading('name', text='Title name')
+        self.queue.column('status', width=100, anchor=tk.W)
+        self.queue.heading('status', text='Status')
+
+        # what was downloaded and still queued when the program was last closed
+        self.download_ledger = open_ledger(DOWNLOAD_DIR)
+        if self.download_ledger:
+            for hshop_id, title_id, name in self.download_ledger.queued():
+                self.queue.insert('', tk.END, text=hshop_id, iid=hshop_id, values=(title_id, name))
+
+        self.downloads: 'Optional[DownloadManager]' = None
 
         def start_downloads():
-            completed = 0
-            self.queue_progress.configure(
-                maximum=len(self.queue.get_children()), value=0)
-            fnames = []
+            if self.downloads:
+                self.downloads.cancel()
+                download_button.configure(text='Cancelling...', state=tk.DISABLED)
+                return
+            if not self.queue.get_children():
+                return
+
+            stream_install = self.stream_install_var.get() == 1
+            installer = None
+            # streams of the titles being installed while they download, by their path in the installer
+            streams: 'Dict[str, GrowingFile]' = {}
+            if stream_install:
+                if not self.check_b9_loaded():
+                    self.show_error('Please choose boot9 first')
+                    return
+                settings = self.check_install_settings()
+                if not settings:
+                    return
+                self.disable_buttons()
+                # readers are closed as soon as their title is installed, which lets the download be moved or removed
+                installer = self.create_installer(*settings, len(self.queue.get_children()),
+                                                  reader_pool=ReaderPool(lambda key: open_cia_stream(streams[key]), 0))
+                if not installer:
+                    self.enable_buttons()
+                    return
+
+            # checking downloads against their TMD needs the title keys, which need boot9
+            verify = not stream_install and self.check_b9_loaded()
+            if not stream_install and not verify:
+                self.log('boot9 is not set, so downloads will not be checked before they are added')
+
+            self.save_download_queue()
+            manager = self.downloads = DownloadManager(stream=stream_install,
+                                                       keep_files=self.keep_downloads_var.get() == 1,
+                                                       ledger=self.download_ledger, verify=verify)
             for item in self.queue.get_children():
-                item_struct = self.queue.item(item, "values")
-                target_item_url = 'https://hshop.erista.me/t/' + item
-
-                self.current_item_progress.configure(
-                    maximum=1, value=0)
-
-                import requests
-                from bs4 import BeautifulSoup
-                self.pg_text.configure(
-                    text=f'Fetching metadata for {item_struct[1]} ({item})')
-                text = requests.get(
-                    target_item_url).text
-                bsoup = BeautifulSoup(text, 'html.parser')
-                download_url = bsoup.find_all(name='a', class_='btn')[
-                    0].attrs['href']
-
-                self.pg_text.configure(
-                    text=f'Requesting download for {item_struct[1]} ({item})')
-
-                from pypdl.pypdl_manager import Pypdl
-                dl = Pypdl()
-                # This awkward little hack is because pypdl doesn't properly
-                # handle hShop's non-standard Content-Disposition header.
-                # We call their function to get the headers, properly parse
-                # the filename, and then give that to Pypdl directly.
-                from email.message import Message
-                msg = Message()
-                header = asyncio.run(dl._get_header(download_url))
-
-                msg['content-disposition'] = header['Content-Disposition']
-                fname = 'downloads/' + msg.get_filename()
-                dl.start(file_path=fname,
-                         url=download_url, block=False, display=False, overwrite=False)
-
-                def sizeof_fmt(num, suffix="B"):
-                    for unit in ("", "K", "M", "G", "T", "P", "E", "Z"):
-                        if abs(num) < 1024.0:
-                            return f"{num:3.2f}{unit}{suffix}"
-                        num /= 1024.0
-                    return f"{num:.1f}Yi{suffix}"
-
-                while dl.wait:
-                    self.pg_text.configure(
-                        text=f'{item_struct[1]} ({item}): Waiting for headers')
+                manager.add(item, self.queue.item(item, 'values')[1])
+            total = len(manager.items)
+
+            if installer:
+                titles = []
+                for item in manager.items:
+                    key = f'{item.name} ({item.hshop_id})'
+                    streams[key] = item.stream
+                    # the rest is only known once the download starts
+                    titles.append((TitleDescriptor(path=key, title_id='', title_name=item.name, install_size=0,
+                                                   tmd_hash=''), key))
+                installer.readers = titles
+
+                def close_streams():
+                    # titles the install didn't get to, so their downloads aren't left waiting for a reader
+                    for stream in streams.values():
+                        stream.close()
+
+                self.run_installer(installer, on_finished=close_streams)
+
+            self.queue_progress.configure(maximum=total, value=0)
+            self.pg_text.configure(text=f'Finding downloads for {total} titles')
+            download_button.configure(text='Cancel')
+
+            # the manager's thread only puts progress here, everything in the window is done from poll
+            progress: 'Queue[DownloadProgress]' = Queue()
+            manager.start(progress)
+
+            def poll():
+                latest = None
+                try:
+                    while True:
+                        latest = progress.get_nowait()
+                except Empty:
                     pass
-                while not dl.completed:
-                    self.pg_text.configure(text=f'{item_struct[1]} ({item}): {
-                                           sizeof_fmt(dl.current_size)}/{sizeof_fmt(dl.size)} {dl.speed:3.2f}MB/s')
-                    self.current_item_progress.configure(
-                        maximum=dl.size, value=dl.current_size)
-                if not dl.failed:
-                    fnames.append(fname)
-                    completed += 1
-                    self.queue_progress.configure(value=completed)
-            self.pg_text.configure(
-                text='Completed ' + str(len(self.queue.get_children())) + ' downloads')
-
-            results = {}
-            for f in fnames:
-                success, reason = self.add_cia(f)
-                if not success:
-                    results[f] = reason
-
-            if results:
+                if latest:
+                    show_download_progress(latest)
+                if latest and latest.finished:
+                    finish_downloads(manager)
+                else:
+                    self.after(DOWNLOAD_POLL_INTERVAL, poll)
+
+            poll()
+
+        def show_download_progress(snapshot: 'DownloadProgress'):
+            active = [i for i in snapshot.items if i.status == DownloadStatus.Downloading]
+            verifying = [i for i in snapshot.items if i.status == DownloadStatus.Verifying]
+            for i in snapshot.items:
+                if i.status == DownloadStatus.Downloading and i.size:
+                    status = f'{i.downloaded * 100 // i.size}%'
+                elif i.status == DownloadStatus.Verifying and i.size:
+                    status = f'Verifying {i.verified * 100 // i.size}%'
+                else:
+                    status = i.status.name
+                self.queue.set(i.hshop_id, 'status', status)
+
+            self.queue_progress.configure(value=snapshot.done)
+            size = sum(i.size or 0 for i in active)
+            self.current_item_progress.configure(maximum=max(size, 1), value=sum(i.downloaded for i in active))
+            text = []
+            if active:
+                text.append(f'Downloading {len(active)} titles at {sizeof_fmt(snapshot.speed)}/s')
+            if verifying:
+                text.append(f'verifying {len(verifying)} at {sizeof_fmt(snapshot.verify_speed)}/s')
+            if text:
+                text.append(f'{snapshot.done}/{len(snapshot.items)} done')
+                self.pg_text.configure(text=', '.join(text).capitalize())
+
+        def finish_downloads(manager: DownloadManager):
+            self.downloads = None
+            download_button.configure(text='Download', state=tk.NORMAL)
+            done = [i for i in manager.items if i.status == DownloadStatus.Done]
+            failed = {f'{i.name} ({i.hshop_id})': i.error for i in manager.items if i.status == DownloadStatus.Failed}
+            self.pg_text.configure(text=f'Completed {len(done)} of {len(manager.items)} downloads')
+            self.queue.delete(*[i.hshop_id for i in done])
+            self.save_download_queue()
+            if done and not manager.stream:
+                self.add_cias([i.path for i in done], failed=failed)
+            elif failed:
                 title_read_fail_window = TitleReadFailResults(
-                    self.parent, failed=results)
+                    self.parent, failed=failed)
                 title_read_fail_window.focus()
-            self.queue.delete(*self.queue.get_children())
-            self.sort_treeview()
 
-        def start_queue():
-            Thread(target=start_downloads).start()
         download_button = ttk.Button(
-            queue_frame, text='Download', command=start_queue)
+            queue_frame, text='Download', command=start_downloads)
         download_button.grid(row=1, column=0)
 
+        download_options_frame = ttk.Frame(queue_frame)
+        download_options_frame.grid(row=2, column=0)
+
+        self.stream_install_var = tk.IntVar()
+        stream_install_checkbox = ttk.Checkbutton(download_options_frame, text='Install while downloading',
+                                                  variable=self.stream_install_var)
+        stream_install_checkbox.grid(row=0, column=0)
+
+        self.keep_downloads_var = tk.IntVar(value=1)
+        keep_downloads_checkbox = ttk.Checkbutton(download_options_frame, text='Keep downloaded files',
+                                                  variable=self.keep_downloads_var)
+        keep_downloads_checkbox.grid(row=0, column=1)
+
         self.current_item_progress = ttk.Progressbar(
             queue_frame, orient=tk.HORIZONTAL, mode='determinate')
-        self.current_item_progress.grid(row=2, column=0)
+        self.current_item_progress.grid(row=3, column=0)
 
         self.queue_progress = ttk.Progressbar(
             queue_frame, orient=tk.HORIZONTAL, mode='determinate')
-        self.queue_progress.grid(row=3, column=0)
+        self.queue_progress.grid(row=4, column=0)
 
         self.pg_text = ttk.Label(queue_frame, text='Waiting')
-        self.pg_text.grid(row=4, column=0)
+        self.pg_text.grid(row=5, column=0)
 
         # ---------------------------------------------------------------- #
         # create treeview
@@ -436,17 +512,8 @@ class TitleManagerWindow(ttk.Frame):
         def add_cias_callback():
             files = fd.askopenfilenames(parent=parent, title='Select CIA files', filetypes=[('CIA files', '*.cia')],
                                         initialdir=file_parent)
-            results = {}
-            for f in files:
-                success, reason = self.add_cia(f)
-                if not success:
-                    results[f] = reason
-
-            if results:
-                title_read_fail_window = TitleReadFailResults(
-                    self.parent, failed=results)
-                title_read_fail_window.focus()
-            self.sort_treeview()
+            if files:
+                self.add_cias(files)
 
         add_cias = ttk.Button(
             titlelist_buttons, text='Add CIAs', command=add_cias_callback)
@@ -475,18 +542,7 @@ class TitleManagerWindow(ttk.Frame):
             d = fd.askdirectory(
                 parent=parent, title='Select folder containing CIA files', initialdir=file_parent)
             if d:
-                results = {}
-                for f in scandir(d):
-                    if f.name.lower().endswith('.cia'):
-                        success, reason = self.add_cia(f.path)
-                        if not success:
-                            results[f] = reason
-
-                if results:
-                    title_read_fail_window = TitleReadFailResults(
-                        self.parent, failed=results)
-                    title_read_fail_window.focus()
-                self.sort_treeview()
+                self.add_cias([f.path for f in scandir(d) if f.name.lower().endswith('.cia')])
 
         add_dirs = ttk.Button(
             titlelist_buttons, text='Add folder', command=add_dirs_callback)
@@ -548,16 +604,26 @@ class TitleManagerWindow(ttk.Frame):
                                                    variable=self.overwrite_saves_var)
         overwrite_saves_checkbox.grid(row=0, column=1)
 
+        self.parallel_install_var = tk.IntVar()
+        parallel_install_checkbox = ttk.Checkbutton(control_frame, text='Install several titles at once',
+                                                    variable=self.parallel_install_var)
+        parallel_install_checkbox.grid(row=0, column=2)
+
+        self.skip_unchanged_var = tk.IntVar()
+        skip_unchanged_checkbox = ttk.Checkbutton(control_frame, text='Skip unchanged contents',
+                                                  variable=self.skip_unchanged_var)
+        skip_unchanged_checkbox.grid(row=0, column=3)
+
         show_console = ttk.Button(
             control_frame, text='Show console', command=self.open_console)
-        show_console.grid(row=0, column=2)
+        show_console.grid(row=0, column=4)
 
         start = ttk.Button(control_frame, text='Start install',
                            command=self.start_install)
-        start.grid(row=0, column=3)
+        start.grid(row=0, column=5)
 
-        tab_control.add(UpdaterFrame(self.file_picker_textboxes, self.queue,
-                        parent=self), text='Update games on SD card')
+        tab_control.add(UpdaterFrame(self.file_picker_textboxes, self.queue, parent=self,
+                                     on_queue_changed=self.save_download_queue), text='Update games on SD card')
 
         self.status_label = ttk.Label(self, text='Waiting...')
         self.status_label.grid(row=7, column=0, sticky=tk.NSEW)
@@ -586,6 +652,11 @@ class TitleManagerWindow(ttk.Frame):
         for idx, pair in enumerate(l):
             self.treeview.move(pair[1], '', idx)
 
+    def save_download_queue(self):
+        if self.download_ledger:
+            self.download_ledger.set_queue([(iid, *self.queue.item(iid, 'values')[:2])
+                                            for iid in self.queue.get_children()])
+
     def check_b9_loaded(self):
         if not self.b9_loaded:
             boot9 = self.file_picker_textboxes['boot9'].get(
@@ -598,7 +669,9 @@ class TitleManagerWindow(ttk.Frame):
         return self.b9_loaded
 
     def update_status(self, path: 'Union[PathLike, bytes, str]', status: InstallStatus):
-        self.treeview.set(path, 'status', statuses[status])
+        # titles installed while they download aren't in the list
+        if self.treeview.exists(path):
+            self.treeview.set(path, 'status', statuses[status])
 
     def add_cia(self, path):
         if not self.check_b9_loaded():
@@ -607,30 +680,105 @@ class TitleManagerWindow(ttk.Frame):
         path = abspath(path)
         if path in self.readers:
             return False, 'File already in list'
+        title, reason = self.read_title(path)
+        self.metadata_cache.save()
+        if not title:
+            return False, reason
+        self.insert_title(path, title)
+        return True, ''
+
+    def add_cias(self, paths: 'Iterable[str]', failed: 'Optional[Dict[str, str]]' = None):
+        """Reads titles on a thread pool and adds each one to the list when it's read.
+
+        Titles that couldn't be added are shown when all of them are done, along with anything already in failed.
+        """
+        if not self.check_b9_loaded():
+            # this shouldn't happen
+            self.show_error('Please choose boot9 first')
+            return
+
+        results = dict(failed or {})
+        to_read = []
+        for path in dict.fromkeys(abspath(p) for p in paths):
+            if path in self.readers:
+                results[path] = 'File already in list'
+            else:
+                to_read.append(path)
+
+        done: 'Queue[Tuple[str, Optional[TitleDescriptor], str]]' = Queue()
+        executor = ThreadPoolExecutor(ADD_TITLE_WORKERS)
+        for path in to_read:
+            executor.submit(lambda p: done.put((p, *self.read_title(p))), path)
+        executor.shutdown(wait=False)
+
+        # starting an install with half of the titles read would be confusing
+        if not self.installing:
+            self.disable_buttons()
+        total = len(to_read)
+        left = total
+        added = 0
+
+        def add_finished():
+            nonlocal left, added
+            try:
+                while True:
+                    path, title, reason = done.get_nowait()
+                    left -= 1
+                    if title:
+                        self.insert_title(path, title)
+                        added += 1
+                    else:
+                        results[path] = reason
+            except Empty:
+                pass
+
+            if left:
+                self.status_label.config(text=f'Reading titles... ({total - left}/{total})')
+                self.after(ADD_TITLE_POLL_INTERVAL, add_finished)
+                return
+
+            self.log(f'Added {added} titles.')
+            self.metadata_cache.save()
+            if not self.installing:
+                self.enable_buttons()
+            self.sort_treeview()
+            if results:
+                title_read_fail_window = TitleReadFailResults(
+                    self.parent, failed=results)
+                title_read_fail_window.focus()
+
+        add_finished()
+
+    def read_title(self, path: str) -> 'Tuple[Optional[TitleDescriptor], str]':
+        """Reads what is needed to add a title to the list, or why it can't be.
+
+        This doesn't touch the window, so it can run on other threads.
+        """
         try:
-            reader = CustomInstall.get_reader(path)
+            title = describe_path(path, self.reader_pool, self.metadata_cache)
         except (CIAError, CDNError, TitleMetadataError):
-            return False, 'Failed to read as a CIA or CDN title, probably corrupt'
+            return None, 'Failed to read as a CIA or CDN title, probably corrupt'
         except MissingSeedError:
-            return False, 'Latest seeddb.bin is required, check the README for details'
+            return None, 'Latest seeddb.bin is required, check the README for details'
         except Exception as e:
-            return False, f'Exception occurred: {type(e).__name__}: {e}'
+            return None, f'Exception occurred: {type(e).__name__}: {e}'
 
-        if reader.tmd.title_id.startswith('00048'):
-            return False, 'DSiWare is not supported'
-        try:
-            title_name = reader.contents[0].exefs.icon.get_app_title(
-            ).short_desc
-        except:
-            title_name = '(No title)'
+        if title.title_id.startswith('00048'):
+            self.reader_pool.discard(path)
+            return None, 'DSiWare is not supported'
+        return title, ''
+
+    def insert_title(self, path: str, title: 'TitleDescriptor'):
         self.treeview.insert('', tk.END, text=path, iid=path,
-                             values=(path, reader.tmd.title_id, title_name, statuses[InstallStatus.Waiting]))
-        self.readers[path] = reader
-        return True, ''
+                             values=(path, title.title_id, title.title_name, statuses[InstallStatus.Waiting]))
+        self.readers[path] = title
+        self.install_sizes.add(path, title.install_size)
 
     def remove_cia(self, path):
         self.treeview.delete(path)
         del self.readers[path]
+        self.install_sizes.remove(path)
+        self.reader_pool.discard(path)
 
     def open_console(self):
         if self.console:
@@ -687,7 +835,8 @@ class TitleManagerWindow(ttk.Frame):
         for b in self.file_picker_textboxes.values():
             b.config(state=tk.NORMAL)
 
-    def start_install(self):
+    def check_install_settings(self) -> 'Optional[Tuple[str, str]]':
+        """Returns the SD root and movable.sed to install with, or None if one is missing or the user stopped."""
         sd_root = self.file_picker_textboxes['sd'].get('1.0', tk.END).strip()
         seeddb = self.file_picker_textboxes['seeddb'].get(
             '1.0', tk.END).strip()
@@ -696,15 +845,21 @@ class TitleManagerWindow(ttk.Frame):
 
         if not sd_root:
             self.show_error('SD root is not specified.')
-            return
+            return None
         if not movable_sed:
             self.show_error('movable.sed is not specified.')
-            return
+            return None
 
         if not seeddb:
             if not self.ask_warning('seeddb was not specified. Titles that require it will fail to install.\n'
                                     'Continue?'):
-                return
+                return None
+        return sd_root, movable_sed
+
+    def start_install(self):
+        settings = self.check_install_settings()
+        if not settings:
+            return
 
         if not len(self.readers):
             self.show_error('There are no titles added to install.')
@@ -714,10 +869,45 @@ class TitleManagerWindow(ttk.Frame):
             self.update_status(path, InstallStatus.Waiting)
         self.disable_buttons()
 
+        installer = self.create_installer(*settings, len(self.readers))
+        if not installer:
+            return
+
+        # use the treeview which has been sorted alphabetically
+        readers_final = []
+        for k in self.treeview.get_children():
+            filepath = self.treeview.set(k, 'filepath')
+            readers_final.append((self.readers[filepath], filepath))
+
+        installer.readers = readers_final
+
+        if self.skip_contents_var.get() != 1:
+            total_size, free_space = installer.check_size(self.install_sizes.total)
+            if total_size > free_space:
+                largest = ''.join(f'\n{self.treeview.set(path, "titlename")}: {size / (1024 * 1024):0.2f} MiB'
+                                  for path, size in self.install_sizes.largest(5))
+                self.show_error(f'Not enough free space.\n'
+                                f'Combined title install size: {
+                                    total_size / (1024 * 1024):0.2f} MiB\n'
+                                f'Free space: {free_space / (1024 * 1024):0.2f} MiB\n'
+                                f'\n'
+                                f'Largest titles:{largest}')
+                self.enable_buttons()
+                return
+
+        self.run_installer(installer)
+
+    def create_installer(self, sd_root: str, movable_sed: str, title_count: int,
+                         reader_pool: 'Optional[ReaderPool]' = None) -> 'Optional[CustomInstall]':
+        """Makes an installer with the options in the window, showing its progress and log there."""
         installer = CustomInstall(movable=movable_sed,
                                   sd=sd_root,
                                   skip_contents=self.skip_contents_var.get() == 1,
-                                  overwrite_saves=self.overwrite_saves_var.get() == 1)
+                                  overwrite_saves=self.overwrite_saves_var.get() == 1,
+                                  install_workers=PARALLEL_INSTALL_WORKERS if self.parallel_install_var.get() == 1 else 1,
+                                  skip_unchanged=self.skip_unchanged_var.get() == 1,
+                                  reader_pool=reader_pool or self.reader_pool,
+                                  metadata_cache=self.metadata_cache)
 
         if not installer.check_for_id0():
             self.show_error(f'id0 {installer.crypto.id0.hex()} was not found inside "Nintendo 3DS" on the SD card.\n'
@@ -725,28 +915,21 @@ class TitleManagerWindow(ttk.Frame):
                             f'Before using custom-install, you should use this SD card on the appropriate console.\n'
                             f'\n'
                             f'Otherwise, make sure the correct movable.sed is being used.')
-            return
+            return None
 
         self.log('Starting install...')
 
-        # use the treeview which has been sorted alphabetically
-        readers_final = []
-        for k in self.treeview.get_children():
-            filepath = self.treeview.set(k, 'filepath')
-            readers_final.append((self.readers[filepath], filepath))
-
-        installer.readers = readers_final
-
-        finished_percent = 0
-        max_percentage = 100 * len(self.readers)
+        max_percentage = 100 * title_count
         self.progressbar.config(maximum=max_percentage)
+        # the installer reports progress from its workers' threads, so it goes through here to run_installer
+        progress = self.install_progress = Queue()
 
         def ci_on_log_msg(message, *args, **kwargs):
             # ignoring end
             self.log(message)
 
         def ci_update_percentage(total_percent, total_read, size):
-            self.progressbar.config(value=total_percent + finished_percent)
+            progress.put(('percent', total_percent))
 
         def ci_on_error(exc):
             for line in format_exception(*exc):
@@ -755,25 +938,19 @@ class TitleManagerWindow(ttk.Frame):
             self.show_error('An error occurred during installation.')
             self.open_console()
 
-        def ci_on_cia_start(idx):
-            nonlocal finished_percent
-            finished_percent = idx * 100
+        def ci_on_cia_start(finished):
+            progress.put(('finished', finished))
 
         installer.event.on_log_msg += ci_on_log_msg
         installer.event.update_percentage += ci_update_percentage
         installer.event.on_error += ci_on_error
         installer.event.on_cia_start += ci_on_cia_start
         installer.event.update_status += self.update_status
+        return installer
 
-        if self.skip_contents_var.get() != 1:
-            total_size, free_space = installer.check_size()
-            if total_size > free_space:
-                self.show_error(f'Not enough free space.\n'
-                                f'Combined title install size: {
-                                    total_size / (1024 * 1024):0.2f} MiB\n'
-                                f'Free space: {free_space / (1024 * 1024):0.2f} MiB')
-                self.enable_buttons()
-                return
+    def run_installer(self, installer: CustomInstall, on_finished: 'Optional[Callable[[], None]]' = None):
+        """Runs an installer from create_installer on another thread, and shows the results when it's done."""
+        progress: 'Queue[Optional[Tuple[str, float]]]' = self.install_progress
 
         def install():
             try:
@@ -791,6 +968,36 @@ class TitleManagerWindow(ttk.Frame):
             except:
                 installer.event.on_error(sys.exc_info())
             finally:
+                self.installing = False
                 self.enable_buttons()
+                if on_finished:
+                    on_finished()
+                progress.put(None)
+
+        finished_percent = 0
+        current_percent = 0
 
+        def poll():
+            nonlocal finished_percent, current_percent
+            done = False
+            try:
+                while True:
+                    update = progress.get_nowait()
+                    if update is None:
+                        done = True
+                        break
+                    kind, value = update
+                    if kind == 'finished':
+                        # the number of titles done so far, the progress of the ones in progress is added on top
+                        finished_percent = value * 100
+                    else:
+                        current_percent = value
+            except Empty:
+                pass
+            self.progressbar.config(value=finished_percent + current_percent)
+            if not done:
+                self.after(INSTALL_POLL_INTERVAL, poll)
+
+        self.installing = True
         Thread(target=install).start()
+        poll()
@@ -1,94 +1,155 @@
 import tkinter as tk
 import tkinter.ttk as ttk
+from queue import Empty
 from threading import Thread
+from typing import TYPE_CHECKING
 
-from hshop.data import find_candidate_linked_content, find_hshop_title
 from hshop.types import RelatedTitle
-from sdfs.titles import collect_existing_titles, get_existing_title_ids
+from hshop.updates import TitleUpdates, UpdateSweep
+from sdfs.titles import collect_existing_titles
+
+if TYPE_CHECKING:
+    from typing import Callable, Optional
+
+    from sdfs.types import InstalledTitle
+
+# how often finished titles are shown while searching, in milliseconds
+UPDATER_POLL_INTERVAL = 50
 
 
 class UpdaterFrame(ttk.Frame):
 
-    def __init__(self, file_picker_textboxes, queue: ttk.Treeview, parent: tk.Tk = None):
+    def __init__(self, file_picker_textboxes, queue: ttk.Treeview, parent: tk.Tk = None,
+                 on_queue_changed: 'Optional[Callable[[], None]]' = None):
         super().__init__(parent, padding='10')
         self.rowconfigure(2, weight=1)
         self.columnconfigure(0, weight=1)
         self.queue = queue
+        self.on_queue_changed = on_queue_changed
+        self.sweep: 'Optional[UpdateSweep]' = None
 
         self.treeview = ttk.Treeview(self)
         self.treeview.grid(row=2, column=0, sticky=tk.NSEW)
         self.file_picker_textboxes = file_picker_textboxes
 
         def search_existing():
+            if self.sweep:
+                self.sweep.cancel()
+                self.load_all_btn.configure(text='Cancelling...', state=tk.DISABLED)
+                return
+
             sd_root = self.file_picker_textboxes['sd'].get(
                 '1.0', tk.END).strip()
-            seeddb = self.file_picker_textboxes['seeddb'].get(
-                '1.0', tk.END).strip()
             movable_sed = self.file_picker_textboxes['movable.sed'].get(
                 '1.0', tk.END).strip()
             boot9 = self.file_picker_textboxes['boot9'].get(
                 '1.0', tk.END).strip()
+            self.treeview.delete(*self.treeview.get_children())
+            self.update_search_progress.configure(value=0)
             self.update_search_text.configure(text='Reading title IDs')
-            t_ids = get_existing_title_ids(boot9, movable_sed, sd_root)
+            self.load_all_btn.configure(text='Cancel search')
+
+            sweep = self.sweep = UpdateSweep()
+            read_error = None
+
+            def read_and_sweep():
+                nonlocal read_error
+                try:
+                    titles = collect_existing_titles(boot9, movable_sed, sd_root)
+                except Exception as e:
+                    read_error = f'{type(e).__name__}: {e}'
+                    titles = []
+                sweep.run(titles)
+
+            Thread(target=read_and_sweep, daemon=True).start()
+
+            install_queue: list[RelatedTitle] = []
             titles_searched = 0
 
-            install_queue = []
-            titles = collect_existing_titles(boot9, movable_sed, sd_root)
-            for r in titles:
-                self.update_search_progress.configure(
-                    value=titles_searched, maximum=len(t_ids)-1)
-                self.update_search_text.configure(
-                    text=f'{titles_searched+1}/{len(t_ids)}: checking updates and DLC for {r.title.short_desc}')
-                titles_searched += 1
-                self.treeview.insert('', tk.END, iid=r.id, text=f'{r.id} {
-                    r.title.short_desc} by {r.title.publisher}', open=True)
-                dlc_available = False
-                update_available = False
-                update: RelatedTitle = None
-                dlc: RelatedTitle = None
-                if r.dlc_id is None or r.update_id is None:
-                    hshop_title = find_hshop_title(r.id)
-                    if hshop_title is None:
-                        continue
-                    related_content = find_candidate_linked_content(
-                        hshop_title.hshop_id)
-                    for rc in related_content:
-                        if rc.relation_type == 'Downloadable Content':
-                            dlc_available = True
-                            dlc = rc
-                        elif rc.relation_type == 'Update':
-                            update_available = True
-                            update = rc
-                if r.dlc_id is not None or dlc_available:
+            def title_name(r: 'InstalledTitle'):
+                # titles without an icon have no name to show
+                return r.title.short_desc if r.title else r.id
+
+            def show_result(result: TitleUpdates):
+                r = result.installed
+                by = f' by {r.title.publisher}' if r.title else ''
+                self.treeview.insert('', tk.END, iid=r.id, text=f'{r.id} {title_name(r)}{by}', open=True)
+                if result.error:
+                    self.treeview.insert(r.id, tk.END, text=f'Could not check: {result.error}')
+                    return
+                if r.dlc_id is not None or result.dlc:
                     text = None
                     id = r.dlc_id
                     if r.dlc_id is not None:
                         text = 'Already installed:'
                     else:
                         text = 'Available:'
-                        id = dlc.title_id
-                        install_queue.append(dlc)
+                        id = result.dlc.title_id
+                        install_queue.append(result.dlc)
                     self.treeview.insert(
-                        r.id, tk.END, text=f'{text} Downloadable Content ({id}) for {r.title.short_desc}')
-                if r.update_id is not None or update_available:
+                        r.id, tk.END, text=f'{text} Downloadable Content ({id}) for {title_name(r)}')
+                if r.update_id is not None or result.update:
                     text = None
                     id = r.update_id
                     if r.update_id is not None:
                         text = 'Already installed:'
                     else:
                         text = 'Available:'
-                        id = update.title_id
-                        install_queue.append(update)
+                        id = result.update.title_id
+                        install_queue.append(result.update)
                     self.treeview.insert(
-                        r.id, tk.END, text=f'{text} Update ({id}) for {r.title.short_desc}')
+                        r.id, tk.END, text=f'{text} Update ({id}) for {title_name(r)}')
+
+            def poll():
+                nonlocal titles_searched
+                finished = False
+                try:
+                    while True:
+                        result = sweep.results.get_nowait()
+                        if result is None:
+                            finished = True
+                            break
+                        titles_searched += 1
+                        show_result(result)
+                        self.update_search_progress.configure(
+                            value=titles_searched, maximum=max(sweep.total, 1))
+                        self.update_search_text.configure(
+                            text=f'{titles_searched}/{sweep.total}: checked updates and DLC for '
+                                 f'{title_name(result.installed)}')
+                except Empty:
+                    pass
+                finally:
+                    if not finished:
+                        # also when a result couldn't be shown, so the sweep is still followed to the end
+                        self.after(UPDATER_POLL_INTERVAL, poll)
+
+                if not finished:
+                    return
+
+                try:
+                    for q in install_queue:
+                        if not self.queue.exists(q.hshop_id):
+                            self.queue.insert('', tk.END, text=q.hshop_id, iid=q.hshop_id,
+                                              values=(q.title_id, q.name))
+                    if install_queue and self.on_queue_changed:
+                        self.on_queue_changed()
+                    if read_error:
+                        text = f'Could not read titles: {read_error}'
+                    elif sweep.cancelled:
+                        text = f'Cancelled after {titles_searched}/{sweep.total} titles'
+                    else:
+                        text = f'Checked {titles_searched} titles, {len(install_queue)} available to download'
+                    self.update_search_text.configure(text=text)
+                finally:
+                    # or the button would be stuck on cancelling
+                    self.sweep = None
+                    self.load_all_btn.configure(text='Search for existing games', state=tk.NORMAL)
 
-            for q in install_queue:
-                self.queue.insert('', tk.END, text=q.hshop_id, iid=q.hshop_id,
-                                  values=(q.hshop_id, q.name))
+            self.after(UPDATER_POLL_INTERVAL, poll)
 
-        load_all_btn = ttk.Button(
-            self, text='Search for existing games', command=lambda: Thread(target=search_existing).start())
-        load_all_btn.grid(row=0, column=0, sticky=tk.NSEW)
+        self.load_all_btn = ttk.Button(
+            self, text='Search for existing games', command=search_existing)
+        self.load_all_btn.grid(row=0, column=0, sticky=tk.NSEW)
 
         label_pair_frame = ttk.Frame(self)
         label_pair_frame.grid(row=1, column=0, sticky=tk.NSEW)
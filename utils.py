@@ -1,8 +1,25 @@
+import sys
 import tkinter
 from enum import Enum
+from os import environ
+from os.path import expanduser, join
 
 CI_VERSION = '3.0'
 
+# name of the directory for cached data, in the platform's cache directory
+CACHE_DIR_NAME = '3ds-title-manager'
+
+
+def get_cache_dir():
+    """Returns the directory to keep cached data in. It isn't created here."""
+    if sys.platform == 'win32':
+        base = environ.get('LOCALAPPDATA') or expanduser('~\\AppData\\Local')
+    elif sys.platform == 'darwin':
+        base = expanduser('~/Library/Caches')
+    else:
+        base = environ.get('XDG_CACHE_HOME') or expanduser('~/.cache')
+    return join(base, CACHE_DIR_NAME)
+
 
 def disable_children(parent: tkinter.Frame):
     for child in parent.winfo_children():